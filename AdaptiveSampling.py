@@ -0,0 +1,49 @@
+#! python
+# -*- coding: utf-8 -*-
+"""
+Adaptive crank angle sampling. Starts from a coarse grid and bisects the
+intervals where the valve crosses the +/- lap lines (the +/-2 lines Analyser
+marks with InspectorLine_y), or where the curve is too far from straight,
+until they are narrower than the tolerance. Valve events come out to well
+under a degree for far fewer solves than a uniform 1 degree sweep.
+"""
+import numpy as np
+
+
+def adaptive_angles(measure, lap=2.0, centre=150.0, step=10, tolerance=0.25,
+                    flatness=0.05):
+    """
+    :param measure: callable taking a list of crank angles and returning the
+    valve position at each
+    :param lap: valve lap; refines around valve displacements of +/- lap
+    :param centre: valve position at mid travel (see
+    Analyser.centre_positions)
+    :param step: coarse crank angle step in degrees
+    :param tolerance: narrowest interval to bisect, in degrees
+    :param flatness: largest allowed departure, in mm, of a sample from the
+    chord between its neighbours
+    :return: sorted crank angles, valve positions at those angles
+    """
+    angles = list(range(0, 360 + step, step))
+    solved = dict(zip(angles, measure(angles)))
+    while True:
+        x = np.array(sorted(solved), dtype=float)
+        y = np.array([solved[a] for a in x]) - centre
+        wide = np.diff(x) > tolerance
+        # Valve crosses a lap line within the interval
+        flags = np.zeros(len(x) - 1, dtype=bool)
+        for line in (lap, -lap):
+            side = np.sign(y - line)
+            flags |= side[:-1] != side[1:]
+        # Interior sample too far off the chord between its neighbours
+        chord = y[:-2] + (y[2:] - y[:-2]) * (x[1:-1] - x[:-2]) / (x[2:] -
+                                                                  x[:-2])
+        bent = np.abs(y[1:-1] - chord) > flatness
+        flags[:-1] |= bent
+        flags[1:] |= bent
+        flags &= wide
+        if not flags.any():
+            return ([int(a) if a.is_integer() else float(a) for a in x],
+                    list(y + centre))
+        mids = list((x[:-1][flags] + x[1:][flags]) / 2)
+        solved.update(zip(mids, measure(mids)))
@@ -1,29 +1,51 @@
 #!/usr/bin/python3.6
+import argparse
 import itertools
 
 from PyQt5 import QtWidgets, QtGui, QtCore
 import pyqtgraph as pg
-import csv
 import sys  # We need sys so that we can pass argv to QApplication
 import os
-import shutil
 from pathlib import Path
-import ast
 import numpy as np
 from sklearn import preprocessing
-from scipy.interpolate import make_interp_spline
 #from scipy.signal import find_peaks
 from InspectorLine import InspectorLine
 from InspectorLine_y import InspectorLine_y
+import Dynamics
+import ResultsFile
+import SteamFlow
+from Smoothing import smooth_curves
+from TravelMap import TravelMap
 
 
 class MainWindow(QtWidgets.QMainWindow):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, file=None, resolution=100, screenshot=True,
+                 travel_map=None, lap=2.0, rpm=None, indicator=None,
+                 **kwargs):
+        """
+        :param file: results file to show - asks for one if not given
+        :param screenshot: save a screenshot to Screenshots/
+        :param travel_map: valve travel map .npy to show (see TravelMap)
+        :param lap: steam lap, marked on the travel map
+        :param rpm: engine speed to show accelerations at (see Dynamics)
+        :param indicator: engine speed to show indicator diagrams at (see
+        SteamFlow)
+        """
         super(MainWindow, self).__init__(*args, **kwargs)
         colour = self.palette().color(QtGui.QPalette.Window)
         self.directory = os.path.dirname(os.path.abspath(__file__))
         self.file = ''
-        self.open_file()
+        self.results = None
+        # Points per smoothed curve, and the spline fitted to the piston and
+        # fwd, mid and rev valve rows, in that order
+        self.resolution = resolution
+        self.spline = None
+        if file is None:
+            self.open_file()
+        else:
+            self.file = file
+            self.results = ResultsFile.load(file)
         self.setMinimumWidth(1800)
         self.setMinimumHeight(1000)
         layout = QtWidgets.QGridLayout()
@@ -81,141 +103,66 @@ class MainWindow(QtWidgets.QMainWindow):
         layout.addWidget(self.graphWidget, 0, 0)
         layout.addWidget(self.graphWidget_1, 0, 1)
         layout.addWidget(self.graphWidget_2, 1, 0)
+        self.panels = {'valve_piston': self.graphWidget,
+                       'eccentric_path': self.graphWidget_1,
+                       'valve_opening': self.graphWidget_2}
 
         self.get_curves()
         self.get_path()
+        if travel_map is not None:
+            self.show_travel_map(travel_map, lap)
+            layout.addWidget(self.graphWidget_3, 1, 1)
+            self.panels['travel_map'] = self.graphWidget_3
+        if rpm is not None:
+            self.get_dynamics(rpm)
+            layout.addWidget(self.graphWidget_4, 2, 0, 1, 2)
+            self.panels['dynamics'] = self.graphWidget_4
+        if indicator is not None:
+            self.get_indicator(indicator, lap)
+            layout.addWidget(self.graphWidget_5, 3, 0, 1, 2)
+            self.panels['indicator'] = self.graphWidget_5
 
-        print(self.rect())
-        image = self.grab(self.rect())
-        image.save(self.directory + "/Screenshots/" + fname + ".png")
+        if screenshot:
+            print(self.rect())
+            image = self.grab(self.rect())
+            image.save(self.directory + "/Screenshots/" + fname + ".png")
 
     def open_file(self):
         dialog = QtWidgets.QFileDialog()
         dialog.setDirectory(self.directory + "/Results")
         dialog.setFileMode(QtWidgets.QFileDialog.ExistingFile)
-        dialog.setNameFilter("Text files (*.csv)")
+        dialog.setNameFilter("Results (*.npz *.csv)")
         if dialog.exec_():
             self.file = dialog.selectedFiles()[0]
-            self.fix_file(self.file)
-
-    def fix_file(self, file):
-        """
-        Bodge to fix empty fields in first row of .csv from
-        FirthValveGearController.py
-        :param file:
-        :return:
-        """
-        in_file = file
-        out_file = 'out.csv'
-        temp_file = '_temp.csv'
-        shutil.copy(in_file, out_file)
-        with open(in_file, "r", newline='') as f_input, \
-                open(out_file, "a", newline='') as f_output, \
-                open(temp_file, "w", newline='') as f_temp:
-            reader = csv.reader(f_input)
-            #row_count = sum(1 for row in reader)
-            #print("ROW COUNT", row_count)
-
-        with open(out_file, 'r', newline='') as out, open(temp_file, "a",
-                                                          newline='') as temp:
-            reader = csv.reader(out)
-            writer = csv.writer(temp, quoting=csv.QUOTE_NONNUMERIC)
-            for row in reader:
-                print("OUT", row)
-                if row[0] == '360':
-                    # Write last row to beginning of temp_file
-                    row[0] = '0'
-                    writer.writerow(row)
-
-        with open(out_file, 'r', newline='') as out, open(temp_file, "a",
-                                                          newline='') as temp:
-            reader = csv.reader(out)
-            writer = csv.writer(temp, quoting=csv.QUOTE_NONNUMERIC)
-            for row in reader:
-                if row[0] != '0':
-                    writer.writerow(row)
-
-        os.remove(in_file)
-        os.rename(temp_file, in_file)
+            self.results = ResultsFile.load(self.file)
 
     def get_path(self):
         """
-        Gets the path coordinates for the eccentric rod rocking lever end and
-        plots them for each cutoff setting.'z' and 'x' refer to FreeCAD's
-        coordinate system, and are plotted as x and y respectively.
-        n.b. Currently, the FreeCAD macro fails to output the first line (0
-        degrees) of coordinates to the .csv file, so these need to be
-        copy-pasted from the last line (360 degrees), which is, of course, the
-        same.
+        Plots the path coordinates of the eccentric rod rocking lever end for
+        each cutoff setting. 'z' and 'x' refer to FreeCAD's coordinate
+        system, and are plotted as x and y respectively.
         :return:
         """
-        path_fwd_z = []
-        path_fwd_x = []
-        path_mid_z = []
-        path_mid_x = []
-        path_rev_z = []
-        path_rev_x = []
-        with open(self.file) as csv_file:
-            csv_reader = csv.reader(csv_file, quoting=csv.QUOTE_NONNUMERIC)
-            for row in csv_reader:
-                fwd = row[5]
-                fwd = ast.literal_eval(fwd)
-                fwd[0] = float(fwd[0][:-3])
-                fwd[1] = float(fwd[1][:-3])
-                path_fwd_z.append(fwd[0])
-                path_fwd_x.append(fwd[1])
-                mid = row[6]
-                mid = ast.literal_eval(mid)
-                mid[0] = float(mid[0][:-3])
-                mid[1] = float(mid[1][:-3])
-                path_mid_z.append(mid[0])
-                path_mid_x.append(mid[1])
-                rev = row[7]
-                rev = ast.literal_eval(rev)
-                rev[0] = float(rev[0][:-3])
-                rev[1] = float(rev[1][:-3])
-                path_rev_z.append(rev[0])
-                path_rev_x.append(rev[1])
+        res = self.results
+        path_fwd_z, path_mid_z, path_rev_z = res.ecc_z
+        path_fwd_x, path_mid_x, path_rev_x = res.ecc_x
         self.plot(self.graphWidget_1, path_fwd_x, path_fwd_z, "Fwd", 'r', 2)
         self.plot(self.graphWidget_1, path_mid_x, path_mid_z, "Mid", 'b',
                   2)
         self.plot(self.graphWidget_1, path_rev_x, path_rev_z, "Rev", 'g', 2)
 
     def get_curves(self):
-        """Reads .csv file and fills lists for pyqtgraph.
-        Row 0 = crankshaft degrees, 1 = piston position, 2 = valve position at
-        mid-gear, 3 = valve position forward, 4 = valve position reverse"""
-        crank_angle = []
-        cutoff_mid = []
-        cutoff_fwd = []
-        cutoff_rev = []
-        piston = []
-
-        with open(self.file) as csv_file:
-            csv_reader = csv.reader(csv_file, quoting=csv.QUOTE_NONNUMERIC)
-            for row in csv_reader:
-                crank_ang = int(row[0])
-                crank_angle.append(crank_ang)
-                piston_pos = row[1]
-                piston_pos = piston_pos[:-3]
-                piston.append(piston_pos)
-                fwd_pos = row[2]
-                fwd_pos = fwd_pos[:-3]
-                fwd_pos = self.centre_positions(float(fwd_pos))
-                cutoff_fwd.append(fwd_pos)
-                mid_pos = row[3]
-                mid_pos = mid_pos[:-3]
-                mid_pos = self.centre_positions(float(mid_pos))
-                cutoff_mid.append(mid_pos)
-                rev_pos = row[4]
-                rev_pos = rev_pos[:-3]
-                rev_pos = self.centre_positions(float(rev_pos))
-                cutoff_rev.append(rev_pos)
+        """Plots the loaded results. Valve rows are forward, mid-gear and
+        reverse, in that order"""
+        res = self.results
+        crank_angle = res.crank
+        piston = res.piston
+        cutoff_fwd, cutoff_mid, cutoff_rev = self.centre_positions(res.valve)
         piston_crv = self.normalize_position_data(piston)
-        piston_crv = self.smooth_curves(crank_angle, piston_crv)
-        fwd = self.smooth_curves(crank_angle, cutoff_fwd)
-        mid = self.smooth_curves(crank_angle, cutoff_mid)
-        rev = self.smooth_curves(crank_angle, cutoff_rev)
+        xnew, ynew, self.spline = smooth_curves(
+            crank_angle, [piston_crv, cutoff_fwd, cutoff_mid, cutoff_rev],
+            self.resolution)
+        piston_crv, fwd, mid, rev = [(xnew, y) for y in ynew]
 
         ports = self.get_valve_openings(piston, cutoff_fwd, cutoff_mid,
                                         cutoff_rev)
@@ -229,27 +176,120 @@ class MainWindow(QtWidgets.QMainWindow):
         self.plot(self.graphWidget_2, ports[0], ports[2], "Mid", 'b', 2)
         self.plot(self.graphWidget_2, ports[0], ports[3], "Rev", 'g', 2)
 
+    def get_dynamics(self, rpm):
+        """
+        Plots piston, valve and eccentric rod end acceleration magnitudes at
+        one engine speed, and prints the peak loads
+        """
+        self.graphWidget_4 = pg.PlotWidget()
+        self.graphWidget_4.setBackground(
+            self.palette().color(QtGui.QPalette.Window))
+        self.graphWidget_4.setTitle("Acceleration at {:g} RPM".format(rpm),
+                                    color='w', size='15pt')
+        styles = {'color': (255, 255, 255), 'font-size': '20px'}
+        self.graphWidget_4.setLabel('left', 'm/s^2', **styles)
+        self.graphWidget_4.setLabel('bottom', 'Crank Degrees', **styles)
+        self.graphWidget_4.addLegend(offset=(1, 0))
+        self.graphWidget_4.showGrid(x=True, y=True)
+        dynamics = Dynamics.sweep(self.results, [rpm])
+        acc = dynamics.acceleration
+        self.plot(self.graphWidget_4, dynamics.crank, acc['piston'][0, 0],
+                  "Piston", 'w', 2)
+        names = self.results.header['names']
+        for i, (name, colour) in enumerate(zip(names, 'rbg')):
+            self.plot(self.graphWidget_4, dynamics.crank, acc['valve'][0, i],
+                      "Valve " + name, colour, 2)
+            self.plot(self.graphWidget_4, dynamics.crank,
+                      acc['eccentric_rod'][0, i], "Ecc Rod " + name, colour,
+                      2, QtCore.Qt.DashLine)
+        Dynamics.print_peaks(Dynamics.peaks(dynamics, names))
+
+    def get_indicator(self, rpm, lap):
+        """
+        Plots the synthetic indicator (p-V) diagram of each cutoff at one
+        engine speed, head end solid and crank end dashed, and prints the
+        indicated work
+        """
+        self.graphWidget_5 = pg.PlotWidget()
+        self.graphWidget_5.setBackground(
+            self.palette().color(QtGui.QPalette.Window))
+        self.graphWidget_5.setTitle("Indicator at {:g} RPM".format(rpm),
+                                    color='w', size='15pt')
+        styles = {'color': (255, 255, 255), 'font-size': '20px'}
+        self.graphWidget_5.setLabel('left', 'bar', **styles)
+        self.graphWidget_5.setLabel('bottom', 'Volume cm^3', **styles)
+        self.graphWidget_5.addLegend(offset=(1, 0))
+        self.graphWidget_5.showGrid(x=True, y=True)
+        indicator = SteamFlow.simulate(self.results, [rpm],
+                                       {'lap': lap / 1000})
+        volume = indicator.volume * 1e6
+        pressure = indicator.pressure[0] / 1e5
+        names = self.results.header['names']
+        for i, (name, colour) in enumerate(zip(names, 'rbg')):
+            head, crank = indicator.work[0, i]
+            self.plot(self.graphWidget_5, volume[0], pressure[i, 0],
+                      "{} {:.2f} J".format(name, head), colour, 2)
+            self.plot(self.graphWidget_5, volume[1], pressure[i, 1],
+                      "{} {:.2f} J".format(name, crank), colour, 2,
+                      QtCore.Qt.DashLine)
+        SteamFlow.print_work(indicator, names)
+
+    def show_travel_map(self, fname, lap):
+        """
+        Heatmap of valve displacement over cutoff and crank angle, with the
+        +/- lap contours. The map is read a chunk at a time from a timer, so
+        big maps - or ones still being generated - appear progressively.
+        """
+        self.travel_map = TravelMap(fname)
+        self.graphWidget_3 = pg.PlotWidget()
+        self.graphWidget_3.setBackground(
+            self.palette().color(QtGui.QPalette.Window))
+        self.graphWidget_3.setTitle("Valve Travel Map", color='w',
+                                    size='15pt')
+        styles = {'color': (255, 255, 255), 'font-size': '20px'}
+        self.graphWidget_3.setLabel('left', 'Cutoff Degrees', **styles)
+        self.graphWidget_3.setLabel('bottom', 'Crank Degrees', **styles)
+        self.map_image = pg.ImageItem()
+        colours = pg.ColorMap([0.0, 0.5, 1.0], [(0, 0, 255), (255, 255, 255),
+                                               (255, 0, 0)])
+        self.map_image.setLookupTable(colours.getLookupTable())
+        self.graphWidget_3.addItem(self.map_image)
+        self.map_image.setRect(QtCore.QRectF(*self.travel_map.extent()))
+        self.map_contours = []
+        for level, colour in ((lap, 'k'), (-lap, 'k')):
+            contour = pg.IsocurveItem(level=level, pen=pg.mkPen(colour,
+                                                                width=2))
+            contour.setParentItem(self.map_image)
+            self.map_contours.append(contour)
+        self.map_timer = QtCore.QTimer(self)
+        self.map_timer.timeout.connect(self.load_travel_map)
+        self.map_timer.start(50)
+        self.load_travel_map()
+
+    def load_travel_map(self):
+        travel_map = self.travel_map
+        if not travel_map.load_next():
+            if travel_map.is_loaded():
+                self.map_timer.stop()
+            return
+        # ImageItem's first axis is x - crank angle
+        image = travel_map.image.T
+        span = np.nanmax(np.abs(image))
+        self.map_image.setImage(image, autoLevels=False, levels=(-span, span))
+        if travel_map.is_loaded():
+            # Contouring is slow on big maps, so it's done once at the end
+            for contour in self.map_contours:
+                contour.setData(image)
+
     def get_valve_openings(self, piston, fwd, mid, rev):
         """
         Plot piston posn in x against valve opening in y
 
         :return:
         """
-        p = []
-        f = []
-        for pos in piston:
-            pos = float(pos)
-            pos = pos - 30
-            p.append(pos)
+        p = np.asarray(piston) - 30
         return p, fwd, mid, rev
 
-    @staticmethod
-    def smooth_curves(x_val, y_val):
-        xnew = np.linspace(min(x_val), max(x_val), 100)
-        spline = make_interp_spline(x_val, y_val, 3)
-        ynew = spline(xnew)
-        return xnew, ynew
-
     @staticmethod
     def centre_positions(val):
         """
@@ -286,8 +326,21 @@ class MainWindow(QtWidgets.QMainWindow):
 
 
 def main():
-    app = QtWidgets.QApplication(sys.argv)
-    mainwin = MainWindow()
+    parser = argparse.ArgumentParser(description='Firth valve gear analyser')
+    parser.add_argument('--resolution', type=int, default=100,
+                        help='points per smoothed curve')
+    parser.add_argument('--map', help='valve travel map .npy to show')
+    parser.add_argument('--lap', type=float, default=2.0,
+                        help='steam lap, contoured on the travel map')
+    parser.add_argument('--rpm', type=float,
+                        help='show accelerations at this engine speed')
+    parser.add_argument('--indicator', type=float, metavar='RPM',
+                        help='show indicator diagrams at this engine speed')
+    args, qt_args = parser.parse_known_args()
+    app = QtWidgets.QApplication(sys.argv[:1] + qt_args)
+    mainwin = MainWindow(resolution=args.resolution, travel_map=args.map,
+                         lap=args.lap, rpm=args.rpm,
+                         indicator=args.indicator)
     mainwin.show()
     sys.exit(app.exec_())
 
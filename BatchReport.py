@@ -0,0 +1,115 @@
+#!/usr/bin/python3.6
+"""
+Renders Analyser's three panels (valve/piston, eccentric rod end path and
+valve opening) for every results file in a directory or glob, with Qt running
+offscreen.
+
+    python3 BatchReport.py Results/ --format png svg --workers 8
+
+Files are shared out across a process pool. A .csv export is skipped when
+the .npz of the same run is there too, as their images would have the same
+names, and a file is skipped when all its images are already newer than
+it. A file that fails to render is reported and the rest carry on.
+"""
+import argparse
+import multiprocessing
+import os
+from pathlib import Path
+import ResultsFile
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+PANELS = ('valve_piston', 'eccentric_path', 'valve_opening')
+
+
+def outputs(fname, out_dir, formats):
+    stem = Path(fname).stem
+    return [os.path.join(out_dir, '{}_{}.{}'.format(stem, panel, fmt))
+            for panel in PANELS for fmt in formats]
+
+
+def runs(files):
+    """
+    :param files: results files
+    :return: files, less any .csv with a .npz of the same name alongside
+    """
+    npz = {f[:-len('.npz')] for f in files if f.endswith('.npz')}
+    return [f for f in files
+            if not (f.endswith('.csv') and f[:-len('.csv')] in npz)]
+
+
+def up_to_date(fname, out_dir, formats):
+    mtime = os.path.getmtime(fname)
+    return all(os.path.exists(f) and os.path.getmtime(f) > mtime
+               for f in outputs(fname, out_dir, formats))
+
+
+def start_qt():
+    """Process pool initializer - one offscreen QApplication per worker"""
+    os.environ['QT_QPA_PLATFORM'] = 'offscreen'
+    global app
+    from PyQt5 import QtWidgets
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+def render(fname, out_dir, formats, resolution):
+    """
+    :return: fname, and the error if it failed
+    """
+    import pyqtgraph.exporters
+    from Analyser import MainWindow
+    try:
+        window = MainWindow(file=fname, resolution=resolution,
+                            screenshot=False)
+        window.show()
+        app.processEvents()
+        images = iter(outputs(fname, out_dir, formats))
+        for panel in PANELS:
+            plot_item = window.panels[panel].getPlotItem()
+            for fmt in formats:
+                if fmt == 'svg':
+                    exporter = pyqtgraph.exporters.SVGExporter(plot_item)
+                else:
+                    exporter = pyqtgraph.exporters.ImageExporter(plot_item)
+                exporter.export(next(images))
+        window.close()
+    except Exception as e:
+        return fname, '{}: {}'.format(type(e).__name__, e)
+    return fname, None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Render Analyser panels for many results files')
+    parser.add_argument('source', nargs='?',
+                        default=os.path.join(DIRECTORY, 'Results'),
+                        help='directory or glob of .npz/.csv results')
+    parser.add_argument('--out', default=os.path.join(DIRECTORY,
+                                                      'Screenshots'))
+    parser.add_argument('--format', nargs='+', default=['png'],
+                        choices=['png', 'svg'])
+    parser.add_argument('--resolution', type=int, default=100,
+                        help='points per smoothed curve')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--force', action='store_true',
+                        help='render files that are already up to date')
+    args = parser.parse_args()
+    os.makedirs(args.out, exist_ok=True)
+    files = [f for f in runs(ResultsFile.find_files(args.source))
+             if args.force or not up_to_date(f, args.out, args.format)]
+    print('RENDERING', len(files), 'FILES')
+    failed = 0
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(args.workers, initializer=start_qt) as pool:
+        jobs = [(f, args.out, args.format, args.resolution) for f in files]
+        for fname, error in pool.starmap(render, jobs):
+            if error:
+                failed += 1
+                print('FAILED', fname, error)
+            else:
+                print('RENDERED', fname)
+    if failed:
+        print(failed, 'FILES FAILED')
+
+
+if __name__ == "__main__":
+    main()
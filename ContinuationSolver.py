@@ -0,0 +1,219 @@
+#! python
+# -*- coding: utf-8 -*-
+"""
+Continuation solver for the Firth linkage's loop-closure equations.
+
+Rather than solving every crank angle from scratch, each pose starts from the
+previous one plus a tangent predictor, dq/dtheta = -J^-1 dF/dtheta, and is
+corrected by Newton's method with the analytic Jacobian. All cutoffs are
+solved together as a batch. Poses that fail to converge are handed to a
+fallback full solve - the assembly, in FreeCAD (see
+ControlPanel.continuation_sweep) - and branch flips in the linkage, the
+Jacobian determinant changing sign between steps, are flagged rather than
+silently producing bad rows. Poses the linkage can't reach at all are
+reported separately from flips.
+
+The joint state q = (beta, gamma, lam, rho, delta) is the angle of the
+eccentric rod centre line, of the die block about the radius link arc
+centre, of the lifting link (rod end to rocker input pin), of the rocker
+input arm and of the valve link, with the geometry of FirthKinematics:
+    F1, F2  E + p u(beta) + o n(beta) - C - r u(gamma)
+    F3, F4  E + l u(beta) + k u(lam) - P - a u(rho)
+    F5      P_z + a sin(rho + A) + v sin(delta) - valve_line
+where u(t) = (cos t, sin t) and n(t) = (-sin t, cos t), in (x, z).
+"""
+from collections import namedtuple
+import numpy as np
+import FirthKinematics
+from FirthKinematics import DEFAULT_DIMENSIONS
+
+ContinuationResult = namedtuple('ContinuationResult', [
+    'sweep', 'converged', 'flipped', 'unreachable'])
+
+
+def closed_form(dims=DEFAULT_DIMENSIONS):
+    """
+    Fallback from FirthKinematics, to run the solver without FreeCAD
+    """
+    def fallback(cutoffs, angle):
+        valve, ecc_z, ecc_x = FirthKinematics.link_positions(
+            [angle], cutoffs, dims)
+        return valve[:, 0], ecc_z[:, 0], ecc_x[:, 0]
+    return fallback
+
+
+class ContinuationSolver(object):
+    """
+    :param cutoff_angles: radius link angles, degrees
+    :param fallback: callable(cutoff_angles, crank_angle) returning valve,
+    ecc_z, ecc_x arrays for those cutoffs, NaN where the pose can't be
+    solved, used to seed the solver and when Newton fails
+    """
+
+    def __init__(self, cutoff_angles, fallback, dims=DEFAULT_DIMENSIONS,
+                 tolerance=1e-10, max_iter=8):
+        self.dims = dims
+        self.cutoffs = np.atleast_1d(np.asarray(cutoff_angles, dtype=float))
+        phi = np.radians(self.cutoffs)
+        self.c_x = dims.reverser_pivot_x + dims.radius_link * np.cos(phi)
+        self.c_z = dims.reverser_pivot_z + dims.radius_link * np.sin(phi)
+        self.p_x = dims.reverser_pivot_x - dims.rocker_pivot_dx
+        self.p_z = dims.rocker_pivot_z
+        self.fallback = fallback
+        self.tolerance = tolerance
+        self.max_iter = max_iter
+
+    def eccentric(self, theta):
+        """
+        Eccentric centre and its derivative with crank angle (radians), as
+        FirthKinematics.link_positions()
+        """
+        d = self.dims
+        angle = -theta + np.radians(d.eccentric_angle - 180)
+        e = d.eccentric_radius
+        return (e * np.cos(angle), e * np.sin(angle),
+                e * np.sin(angle), -e * np.cos(angle))
+
+    def residual(self, q, theta):
+        d = self.dims
+        e_x, e_z, _, _ = self.eccentric(theta)
+        beta, gamma, lam, rho, delta = q.T
+        length = d.die_pin + d.eccentric_rod_end
+        out = rho + np.radians(d.rocker_angle)
+        return np.stack([
+            e_x + d.die_pin * np.cos(beta) - d.die_offset * np.sin(beta) -
+            self.c_x - d.radius_link * np.cos(gamma),
+            e_z + d.die_pin * np.sin(beta) + d.die_offset * np.cos(beta) -
+            self.c_z - d.radius_link * np.sin(gamma),
+            e_x + length * np.cos(beta) + d.lifting_link * np.cos(lam) -
+            self.p_x - d.rocker_arm * np.cos(rho),
+            e_z + length * np.sin(beta) + d.lifting_link * np.sin(lam) -
+            self.p_z - d.rocker_arm * np.sin(rho),
+            self.p_z + d.rocker_arm * np.sin(out) +
+            d.valve_link * np.sin(delta) - d.valve_line], axis=-1)
+
+    def jacobian(self, q):
+        d = self.dims
+        beta, gamma, lam, rho, delta = q.T
+        p, o, r = d.die_pin, d.die_offset, d.radius_link
+        length = d.die_pin + d.eccentric_rod_end
+        k, a = d.lifting_link, d.rocker_arm
+        out = rho + np.radians(d.rocker_angle)
+        zero = np.zeros_like(beta)
+        return np.stack([
+            np.stack([-p * np.sin(beta) - o * np.cos(beta),
+                      r * np.sin(gamma), zero, zero, zero], -1),
+            np.stack([p * np.cos(beta) - o * np.sin(beta),
+                      -r * np.cos(gamma), zero, zero, zero], -1),
+            np.stack([-length * np.sin(beta), zero, -k * np.sin(lam),
+                      a * np.sin(rho), zero], -1),
+            np.stack([length * np.cos(beta), zero, k * np.cos(lam),
+                      -a * np.cos(rho), zero], -1),
+            np.stack([zero, zero, zero, a * np.cos(out),
+                      d.valve_link * np.cos(delta)], -1)], axis=-2)
+
+    def tangent(self, q, theta):
+        """dq/dtheta from differentiating F(q(theta), theta) = 0"""
+        _, _, de_x, de_z = self.eccentric(theta)
+        f_theta = np.array([de_x, de_z, de_x, de_z, 0.0])
+        f_theta = np.broadcast_to(f_theta, q.shape)
+        return -np.linalg.solve(self.jacobian(q), f_theta[..., np.newaxis])[
+            ..., 0]
+
+    def newton(self, q, theta):
+        """
+        :return: corrected state, and which rows converged
+        """
+        for _ in range(self.max_iter):
+            f = self.residual(q, theta)
+            converged = np.abs(f).max(axis=-1) < self.tolerance
+            if converged.all():
+                break
+            try:
+                step = np.linalg.solve(self.jacobian(q), f[..., np.newaxis])
+            except np.linalg.LinAlgError:
+                break
+            q = q - np.where(converged[:, np.newaxis], 0, step[..., 0])
+        f = self.residual(q, theta)
+        return q, np.abs(f).max(axis=-1) < self.tolerance
+
+    def state(self, valve, ecc_z, ecc_x, theta, rows=slice(None)):
+        """
+        Joint state from a measured pose, e.g. a fallback solve
+        :param rows: the cutoffs the pose is for
+        """
+        d = self.dims
+        e_x, e_z, _, _ = self.eccentric(theta)
+        beta = np.arctan2(ecc_z - e_z, ecc_x - e_x)
+        d_x = e_x + d.die_pin * np.cos(beta) - d.die_offset * np.sin(beta)
+        d_z = e_z + d.die_pin * np.sin(beta) + d.die_offset * np.cos(beta)
+        gamma = np.arctan2(d_z - self.c_z[rows], d_x - self.c_x[rows])
+        i_x, i_z = FirthKinematics.intersect(
+            ecc_x, ecc_z, d.lifting_link, self.p_x, self.p_z, d.rocker_arm,
+            -1)
+        lam = np.arctan2(i_z - ecc_z, i_x - ecc_x)
+        rho = np.arctan2(i_z - self.p_z, i_x - self.p_x)
+        out = rho + np.radians(d.rocker_angle)
+        o_x = self.p_x + d.rocker_arm * np.cos(out)
+        o_z = self.p_z + d.rocker_arm * np.sin(out)
+        delta = np.arctan2(d.valve_line - o_z, d.valve_rod - valve - o_x)
+        return np.stack([beta, gamma, lam, rho, delta], axis=-1)
+
+    def pose(self, q, theta):
+        """valve, ecc_z, ecc_x from the joint state"""
+        d = self.dims
+        e_x, e_z, _, _ = self.eccentric(theta)
+        beta, gamma, lam, rho, delta = q.T
+        length = d.die_pin + d.eccentric_rod_end
+        out = rho + np.radians(d.rocker_angle)
+        v_x = (self.p_x + d.rocker_arm * np.cos(out) +
+               d.valve_link * np.cos(delta))
+        return (d.valve_rod - v_x, e_z + length * np.sin(beta),
+                e_x + length * np.cos(beta))
+
+    def sweep(self, crank_angles):
+        """
+        Follows the mechanism through the crank angles in order
+        :param crank_angles: 1-D array of crank angles, degrees
+        :return: ContinuationResult - the KinematicSweep, which poses Newton
+        solved (the rest came from the fallback), where the branch flipped
+        and which poses the fallback couldn't solve either (NaN in the
+        sweep, and not counted as flips)
+        """
+        crank = np.asarray(crank_angles, dtype=float)
+        k, n = len(self.cutoffs), len(crank)
+        valve, ecc_z, ecc_x = (np.empty((k, n)) for _ in range(3))
+        converged = np.zeros((k, n), dtype=bool)
+        flipped = np.zeros((k, n), dtype=bool)
+        unreachable = np.zeros((k, n), dtype=bool)
+        theta = np.radians(crank)
+        q = self.state(*self.fallback(self.cutoffs, crank[0]), theta[0])
+        # Last determinant of each row's real poses
+        det = np.full(k, np.nan)
+        for i in range(n):
+            if i > 0:
+                # Predictor
+                with np.errstate(invalid='ignore'):
+                    try:
+                        q = q + self.tangent(q, theta[i - 1]) * (
+                            theta[i] - theta[i - 1])
+                    except np.linalg.LinAlgError:
+                        pass
+            with np.errstate(invalid='ignore'):
+                q, ok = self.newton(q, theta[i])
+            if not ok.all():
+                missed = ~ok
+                pose = self.fallback(self.cutoffs[missed], crank[i])
+                q[missed] = self.state(*pose, theta=theta[i], rows=missed)
+            with np.errstate(invalid='ignore'):
+                new_det = np.linalg.det(self.jacobian(q))
+            real = np.isfinite(new_det)
+            flipped[:, i] = real & (np.sign(new_det) * np.sign(det) < 0)
+            det = np.where(real, new_det, det)
+            unreachable[:, i] = ~real
+            converged[:, i] = ok
+            valve[:, i], ecc_z[:, i], ecc_x[:, i] = self.pose(q, theta[i])
+        piston = FirthKinematics.piston_positions(crank, self.dims)
+        sweep = FirthKinematics.KinematicSweep(crank, self.cutoffs, piston,
+                                               valve, ecc_z, ecc_x)
+        return ContinuationResult(sweep, converged, flipped, unreachable)
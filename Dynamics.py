@@ -0,0 +1,132 @@
+#!/usr/bin/python3.6
+"""
+Valve gear dynamics at engine speed.
+
+The piston, valve and eccentric rod end curves of a run are fitted with the
+periodic spline (see Smoothing) and differentiated analytically with
+respect to crank angle. At a steady speed of w degrees per second,
+    velocity = dy/dtheta * w,   acceleration = d2y/dtheta2 * w^2
+and the inertial force on each component is its mass times its
+acceleration. Every RPM, cutoff and crank angle is evaluated in one
+broadcast pass, as arrays of shape (rpm, cutoff, crank).
+
+    python3 Dynamics.py Results/Test.npz --rpm 500 1000 1500 2000
+"""
+import argparse
+from collections import namedtuple
+import numpy as np
+import ResultsFile
+from Smoothing import fit
+
+# Moving masses, kg - nominal, override on the command line
+MASSES = {'piston': 0.020, 'valve': 0.005, 'eccentric_rod': 0.008}
+COMPONENTS = ('piston', 'valve', 'eccentric_rod')
+
+DynamicsSweep = namedtuple('DynamicsSweep', [
+    'rpm', 'crank', 'cutoffs', 'velocity', 'acceleration', 'force'])
+
+
+def derivatives(results, crank):
+    """
+    First and second derivatives of every curve with respect to crank
+    angle, mm per degree and per degree squared
+    :return: dicts of component: (cutoff, crank) arrays. The piston is
+    repeated for each cutoff, and the eccentric rod end is its (z, x) pair
+    stacked on a leading axis.
+    """
+    k = len(results.valve)
+    spline = fit(results.crank, np.vstack([results.piston, results.valve,
+                                           results.ecc_z, results.ecc_x]))
+    first = spline.derivative(1)(crank)
+    second = spline.derivative(2)(crank)
+
+    def split(d):
+        return {'piston': np.broadcast_to(d[0], (k, len(crank))),
+                'valve': d[1:1 + k],
+                'eccentric_rod': np.stack([d[1 + k:1 + 2 * k],
+                                           d[1 + 2 * k:]])}
+    return split(first), split(second)
+
+
+def magnitude(component, values):
+    """Speed or acceleration magnitude, along the path for the rod end"""
+    if component == 'eccentric_rod':
+        return np.hypot(values[0], values[1])
+    return np.abs(values)
+
+
+def sweep(results, rpm, crank=None, masses=None):
+    """
+    :param results: ResultsFile.Results
+    :param rpm: engine speeds
+    :param crank: crank angles to evaluate at, default every 0.5 degree
+    :param masses: kg per component, see MASSES
+    :return: DynamicsSweep - velocity m/s, acceleration m/s^2 and force N,
+    dicts of component: (rpm, cutoff, crank) arrays of magnitudes
+    """
+    masses = dict(MASSES, **(masses or {}))
+    if crank is None:
+        crank = np.arange(results.crank[0], results.crank[-1] + 0.25, 0.5)
+    rpm = np.asarray(rpm, dtype=float)
+    # degrees per second, shaped to broadcast over (cutoff, crank)
+    w = (rpm * 6.0)[:, np.newaxis, np.newaxis]
+    first, second = derivatives(results, crank)
+    velocity, acceleration, force = {}, {}, {}
+    for c in COMPONENTS:
+        # mm -> m
+        velocity[c] = magnitude(c, first[c]) * w / 1000
+        acceleration[c] = magnitude(c, second[c]) * w ** 2 / 1000
+        force[c] = masses[c] * acceleration[c]
+    return DynamicsSweep(rpm, crank, results.header['cutoffs'], velocity,
+                         acceleration, force)
+
+
+def peaks(dynamics, names):
+    """
+    :param names: name of each cutoff
+    :return: rows of component, cutoff name, rpm, peak velocity,
+    peak acceleration, peak force and the crank angle it occurs at
+    """
+    rows = []
+    for c in COMPONENTS:
+        v = dynamics.velocity[c].max(axis=-1)
+        i = dynamics.acceleration[c].argmax(axis=-1)
+        a = dynamics.acceleration[c].max(axis=-1)
+        f = dynamics.force[c].max(axis=-1)
+        for j, rpm in enumerate(dynamics.rpm):
+            for k, name in enumerate(names):
+                if c == 'piston' and k > 0:
+                    continue
+                rows.append([c, '-' if c == 'piston' else name, rpm,
+                             v[j, k], a[j, k], f[j, k],
+                             dynamics.crank[i[j, k]]])
+    return rows
+
+
+def print_peaks(rows):
+    print('{:<14}{:>6}{:>8}{:>10}{:>12}{:>10}{:>8}'.format(
+        'COMPONENT', 'GEAR', 'RPM', 'V M/S', 'A M/S2', 'F N', 'DEG'))
+    for c, name, rpm, v, a, f, angle in rows:
+        print('{:<14}{:>6}{:>8.0f}{:>10.3f}{:>12.1f}{:>10.2f}{:>8.1f}'.format(
+            c, name, rpm, v, a, f, angle))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Valve gear velocity, acceleration and inertial load '
+                    'over engine speed')
+    parser.add_argument('file', help='.npz or .csv results file')
+    parser.add_argument('--rpm', nargs='+', type=float,
+                        default=[500, 1000, 1500, 2000])
+    for c in COMPONENTS:
+        parser.add_argument('--' + c.replace('_', '-') + '-mass', type=float,
+                            default=MASSES[c], dest=c, help='kg')
+    args = parser.parse_args()
+    results = ResultsFile.load(args.file)
+    dynamics = sweep(results, args.rpm,
+                     masses={c: getattr(args, c) for c in COMPONENTS})
+    print_peaks(peaks(dynamics, results.header['names']))
+
+
+if __name__ == "__main__":
+    main()
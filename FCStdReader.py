@@ -0,0 +1,292 @@
+#!/usr/bin/python3.6
+"""
+Reads model parameters straight out of a .FCStd without starting FreeCAD.
+
+Document.xml is streamed from the zip with iterparse and each object is
+discarded once read, so no DOM of the ~1 MB file is built. Extracted are
+every object's type, label and scalar properties, the datum constraints of
+each sketch (angles in degrees), the Assembly3 constraints and the driver
+objects. The result is cached as JSON next to the model, keyed on the hash
+of its Document.xml and CACHE_FORMAT, so it's only parsed once per saved
+model and is read afresh when what's extracted changes.
+
+    python3 FCStdReader.py ValveGear_Z7S.FCStd
+"""
+import argparse
+import hashlib
+import io
+import json
+import math
+import os
+import zipfile
+import xml.etree.ElementTree as ET
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+MODEL = os.path.join(DIRECTORY, 'ValveGear_Z7S.FCStd')
+
+# Sketcher constraint types that carry a value
+DATUM_TYPES = {6: 'Distance', 7: 'DistanceX', 8: 'DistanceY', 9: 'Angle',
+               11: 'Radius', 18: 'Diameter', 19: 'Weight'}
+# The sketch datum each FirthKinematics.LinkageDimensions field is read from,
+# by name where the model names it, otherwise by its index in the sketch's
+# constraints (as used by setDatum())
+DIMENSIONS = {
+    'crank_radius': ('Sketch001', 4),
+    'eccentric_radius': ('Sketch001', 10),
+    'eccentric_angle': ('Sketch001', 11),
+    'rod_length': ('Sketch002', 5),
+    'piston_rod': ('Sketch003', 4),
+    'piston_half_width': ('Sketch003', 19),
+    'piston_mark': ('Sketch', 9),
+    'reverser_pivot_x': ('Sketch004', 7),
+    'reverser_pivot_z': ('Sketch004', 8),
+    'radius_link': ('Sketch004', 0),
+    'die_pin': ('Sketch005', 1),
+    'die_offset': ('Sketch005', 7),
+    'eccentric_rod_end': ('Sketch005', 4),
+    'lifting_link': ('Sketch006', 5),
+    'rocker_pivot_dx': ('Sketch', 18),
+    'rocker_pivot_z': ('Sketch', 19),
+    'rocker_arm': ('Sketch007', 2),
+    'rocker_angle': ('Sketch007', 4),
+    'valve_link': ('Sketch008', 1),
+    'valve_line': ('Sketch', 25),
+    'valve_rod': ('Sketch009', 1),
+}
+CUTOFF = ('Sketch004', 'Cutoff CTRL')
+DRIVER = 'Constraint001'
+# Measure constraint of each measurement, see FirthKinematics.REFERENCE
+MEASURES = {'piston': 'Constraint019', 'valve': 'Constraint020',
+            'ecc_x': 'Constraint021', 'ecc_z': 'Constraint022'}
+# Assembly3 constraint properties that are solver output or display state,
+# not part of the design
+OUTPUTS = {'Label2', 'TreeRank', 'Visibility'}
+MEASURED = {'Angle', 'Distance'}
+SCALARS = {'Float': float, 'Integer': int, 'String': str,
+           'Bool': lambda v: v == 'true'}
+# Version of what read_model() extracts - bump it whenever that changes, so
+# caches written by older code aren't used
+CACHE_FORMAT = 2
+
+
+def parse(source):
+    """
+    :param source: Document.xml file object
+    :return: {object name: {'type', 'label', 'properties', 'datums'}}
+    """
+    objects = {}
+    in_data = False
+    obj = prop = None
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        tag = elem.tag
+        if event == 'start':
+            if tag == 'ObjectData':
+                in_data = True
+            elif tag == 'Object':
+                name = elem.get('name')
+                obj = objects.setdefault(name, {'properties': {}})
+                if not in_data:
+                    obj['type'] = elem.get('type')
+            elif tag == 'Property' and obj is not None:
+                prop = elem.get('name')
+            elif tag in SCALARS and prop is not None and \
+                    elem.get('value') is not None:
+                obj['properties'][prop] = SCALARS[tag](elem.get('value'))
+            elif tag == 'Constrain' and obj is not None:
+                datums = obj.setdefault('datums', [])
+                datums.append(datum(len(datums), elem))
+            elif tag == 'Python' and prop == 'Proxy':
+                obj['proxy'] = elem.get('class')
+        elif tag == 'Property':
+            prop = None
+        elif tag == 'Object':
+            obj = None
+            if in_data:
+                elem.clear()
+    for obj in objects.values():
+        obj['label'] = obj['properties'].get('Label', '')
+        obj['datums'] = [d for d in obj.get('datums', [])
+                         if d['type'] is not None]
+    return objects
+
+
+def datum(index, elem):
+    """
+    A sketch constraint - datum index as used by setDatum(), name, type and
+    value, in degrees for angles
+    """
+    kind = DATUM_TYPES.get(int(elem.get('Type')))
+    value = float(elem.get('Value'))
+    if kind == 'Angle':
+        value = math.degrees(value)
+    return {'index': index, 'name': elem.get('Name'), 'type': kind,
+            'value': value}
+
+
+def document_hash(fcstd):
+    """
+    :param fcstd: path to the .FCStd file
+    :return: sha1 hex digest of its Document.xml
+    """
+    with zipfile.ZipFile(fcstd) as archive:
+        return hashlib.sha1(archive.read('Document.xml')).hexdigest()
+
+
+def design_hash(objects):
+    """
+    Hash of the model's design - every sketch datum and Assembly3 constraint
+    setting - leaving out what a sweep changes or the solver writes back: the
+    cutoff datum, the driver's Angle, the measure constraints' readings and
+    the parts' placements. So jogging the crank, setting a cutoff or saving
+    mid-sweep doesn't change it, but editing a dimension does.
+    :param objects: see parse()
+    :return: sha1 hex digest
+    """
+    sketch, name = CUTOFF
+    design = {}
+    for obj_name, obj in objects.items():
+        datums = [(d['index'], d['type'], d['value']) for d in obj['datums']
+                  if not (obj_name == sketch and d['name'] == name)]
+        if datums:
+            design[obj_name] = datums
+        if obj.get('proxy') == 'AsmConstraint':
+            skip = set(OUTPUTS)
+            if obj['label'].endswith('Driver'):
+                skip.add('Angle')
+            if obj['label'].startswith('Measure'):
+                skip.update(MEASURED)
+            design[obj_name + '.constraint'] = sorted(
+                (k, v) for k, v in obj['properties'].items() if k not in skip)
+    return hashlib.sha1(json.dumps(design, sort_keys=True).encode()) \
+        .hexdigest()
+
+
+def read_model(fcstd):
+    """
+    :return: dict - design hash, objects (see parse()), sketch datums,
+    Assembly3 constraints and driver names
+    """
+    with zipfile.ZipFile(fcstd) as archive:
+        with archive.open('Document.xml') as source:
+            return describe(parse(source))
+
+
+def read_document(document):
+    """
+    read_model() of an open FreeCAD document, as it is now - including
+    edits that haven't been saved
+    """
+    return describe(parse(io.BytesIO(document.Content.encode())))
+
+
+def describe(objects):
+    """
+    :param objects: see parse()
+    :return: see read_model()
+    """
+    return {
+        'model': design_hash(objects),
+        'objects': objects,
+        'sketches': {name: obj['datums'] for name, obj in objects.items()
+                     if obj['datums']},
+        'constraints': {name: obj['properties'] for name, obj in
+                        objects.items()
+                        if obj.get('proxy') == 'AsmConstraint'},
+        'drivers': sorted(name for name, obj in objects.items()
+                          if obj['label'].endswith('Driver')),
+    }
+
+
+def load_model(fcstd=MODEL, cache=True):
+    """
+    read_model(), from the cache if the model hasn't changed since it was
+    last read
+    """
+    if not cache:
+        return read_model(fcstd)
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(fcstd)),
+                             '.fcstd_cache')
+    cache_file = os.path.join(cache_dir, '{}.v{}.json'.format(
+        document_hash(fcstd), CACHE_FORMAT))
+    if os.path.exists(cache_file):
+        with open(cache_file) as f:
+            return json.load(f)
+    model = read_model(fcstd)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(cache_file, 'w') as f:
+        json.dump(model, f)
+    return model
+
+
+def sketch_datum(model, sketch, key):
+    """
+    Value of a sketch's datum, by name or index - e.g.
+    sketch_datum(m, 'Sketch004', 'Cutoff CTRL'), sketch_datum(m, 'Sketch', 9)
+    """
+    field = 'name' if isinstance(key, str) else 'index'
+    for d in model['sketches'].get(sketch, []):
+        if d[field] == key:
+            return d['value']
+    raise KeyError('{} has no datum {!r}'.format(sketch, key))
+
+
+def dimensions(model, datums=DIMENSIONS):
+    """
+    :return: {LinkageDimensions field: value} for every field in datums
+    :raises KeyError: naming all the datums the model hasn't got
+    """
+    dims, missing = {}, []
+    for field, (sketch, key) in sorted(datums.items()):
+        try:
+            dims[field] = sketch_datum(model, sketch, key)
+        except KeyError:
+            missing.append('{} {}[{}]'.format(field, sketch, key))
+    if missing:
+        raise KeyError('MODEL HAS NO DATUM FOR ' + ', '.join(missing))
+    return dims
+
+
+def cutoff(model):
+    """Radius link angle the model was saved at, degrees"""
+    return sketch_datum(model, *CUTOFF)
+
+
+def reference(model):
+    """
+    The pose the model was saved in and what its measure constraints read
+    there, to check FirthKinematics against
+    :return: dict as FirthKinematics.REFERENCE
+    """
+    pose = {'crank': model['constraints'][DRIVER]['Angle'],
+            'cutoff': cutoff(model)}
+    for name, constraint in MEASURES.items():
+        pose[name] = model['constraints'][constraint]['Distance']
+    return pose
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Model parameters from a .FCStd, without FreeCAD')
+    parser.add_argument('fcstd', nargs='?', default=MODEL)
+    parser.add_argument('--no-cache', action='store_true')
+    args = parser.parse_args()
+    model = load_model(args.fcstd, cache=not args.no_cache)
+    print('MODEL', model['model'])
+    print('DRIVERS', ', '.join(model['drivers']))
+    print('CUTOFF {:.3f} DEG'.format(cutoff(model)))
+    for field, value in sorted(dimensions(model).items()):
+        print('DIMENSION {} = {:.4f}'.format(field, value))
+    for name, datums in sorted(model['sketches'].items()):
+        for d in datums:
+            if d['name']:
+                print('{} [{}] {} ({}) = {:.4f}'.format(
+                    name, d['index'], d['name'], d['type'], d['value']))
+    for name, props in sorted(model['constraints'].items()):
+        if 'Distance' in props and props.get('Label', '').startswith(
+                'Measure'):
+            print('{} {} = {:.4f}'.format(name, props['Label'],
+                                          props['Distance']))
+
+
+if __name__ == "__main__":
+    main()
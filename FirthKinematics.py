@@ -0,0 +1,258 @@
+#!/usr/bin/python3.6
+"""
+Closed-form kinematics of the Firth valve gear.
+
+Computes piston position, valve position and eccentric rod end (z, x) for
+whole arrays of crank angles and cutoff (radius link) angles in one
+vectorized call, without FreeCAD, as the assembly's measure constraints
+report them:
+    piston  Constraint019, piston mid point to the 180 mm mark
+    valve   Constraint020, valve rod end to the crank centre line
+    ecc_x   Constraint021, lifting link bottom bush to the YZ plane
+    ecc_z   Constraint022, lifting link bottom bush to the XY plane
+Every sketch lies in FreeCAD's XZ plane, so sketch x is FreeCAD x (along the
+cylinder axis, the cylinder to -x) and sketch y is FreeCAD z, with the
+crankshaft centre at the origin.
+
+The mechanism, part by part:
+    - Sketch001 crankshaft - crank pin and eccentric, turning clockwise as
+      the driver angle (Constraint001) increases,
+    - Sketch002 connecting rod and Sketch003 piston, on the cylinder axis,
+    - Sketch004 radius link - an arc swung about the reverser pivot by the
+      cutoff angle (datum 5, 'Cutoff CTRL'); 90 degrees is mid gear,
+    - Sketch005 eccentric rod, with its die block (offset from the rod's
+      centre line) running in the radius link arc,
+    - Sketch006 lifting link, from the eccentric rod end to the rocking
+      lever (Sketch007) input arm; the output arm drives
+    - Sketch008 valve link and Sketch009 valve, along the valve line.
+
+DEFAULT_DIMENSIONS are the datums of those sketches (see FCStdReader), and
+reproduce the pose the model was saved in to within 1e-5 mm, the assembly
+solver's own precision (see check()). The crank's direction isn't fixed by
+that one pose; clockwise is the sense in which the forward cutoff (75) runs
+with the crank angle increasing and the reverse one (115) with it
+decreasing, as ValveEvents assumes.
+"""
+import argparse
+from collections import namedtuple
+import numpy as np
+import Harmonics
+import ResultsFile
+
+
+LinkageDimensions = namedtuple('LinkageDimensions', [
+    'crank_radius',         # Sketch001 [4]
+    'eccentric_radius',     # Sketch001 [10]
+    'eccentric_angle',      # Sketch001 [11], eccentric to crank, degrees
+    'rod_length',           # Sketch002 [5]
+    'piston_rod',           # Sketch003 [4], crosshead pin to piston
+    'piston_half_width',    # Sketch003 [19], piston to its mid point
+    'piston_mark',          # Sketch [9], crank centre to the 180 mm mark
+    'reverser_pivot_x',     # Sketch004 [7]
+    'reverser_pivot_z',     # Sketch004 [8]
+    'radius_link',          # Sketch004 [0], radius of the link arc
+    'die_pin',              # Sketch005 [1], eccentric to die block
+    'die_offset',           # Sketch005 [7], die block off the rod line
+    'eccentric_rod_end',    # Sketch005 [4], die block to rod end bush
+    'lifting_link',         # Sketch006 [5]
+    'rocker_pivot_dx',      # Sketch [18], rocker pivot behind the reverser
+    'rocker_pivot_z',       # Sketch [19]
+    'rocker_arm',           # Sketch007 [2], both arms
+    'rocker_angle',         # Sketch007 [4], between the arms, degrees
+    'valve_link',           # Sketch008 [1]
+    'valve_line',           # Sketch [25], height of the valve spindle
+    'valve_rod',            # Sketch009 [1], valve pin to valve rod end
+])
+
+DEFAULT_DIMENSIONS = LinkageDimensions(
+    crank_radius=15.0,
+    eccentric_radius=3.4,
+    eccentric_angle=270.0,
+    rod_length=90.0,
+    piston_rod=55.75,
+    piston_half_width=4.75,
+    piston_mark=180.0,
+    reverser_pivot_x=-54.0,
+    reverser_pivot_z=-9.5,
+    radius_link=45.0,
+    die_pin=54.8,
+    die_offset=1.5,
+    eccentric_rod_end=20.0,
+    lifting_link=22.3,
+    rocker_pivot_dx=30.0,
+    rocker_pivot_z=11.0,
+    rocker_arm=8.5,
+    rocker_angle=100.0,
+    valve_link=12.0,
+    valve_line=19.0,
+    valve_rod=52.3,
+)
+
+# The pose ValveGear_Z7S.FCStd was saved in - driver angle, cutoff and the
+# Distance of Constraint019 - 022
+REFERENCE = {'crank': 360.0, 'cutoff': 115.0,
+             'piston': 44.5000021348708614, 'valve': 149.1722694360169896,
+             'ecc_x': -73.2426813877417686, 'ecc_z': -11.7838606125243501}
+
+KinematicSweep = namedtuple('KinematicSweep', [
+    'crank', 'cutoffs', 'piston', 'valve', 'ecc_z', 'ecc_x'])
+
+
+def crank_direction(crank_angles):
+    """Crank pin direction in the sketch plane, radians - clockwise"""
+    return -np.radians(np.asarray(crank_angles, dtype=float))
+
+
+def intersect(p_x, p_z, p_r, q_x, q_z, q_r, side):
+    """
+    One intersection of the circles about p and q, on the left (side=1) or
+    right (side=-1) of the line from p to q. NaN where they don't meet.
+    """
+    d_x, d_z = q_x - p_x, q_z - p_z
+    d = np.hypot(d_x, d_z)
+    a = (p_r ** 2 - q_r ** 2 + d ** 2) / (2 * d)
+    with np.errstate(invalid='ignore'):
+        h = side * np.sqrt(p_r ** 2 - a ** 2)
+    return (p_x + (a * d_x - h * d_z) / d,
+            p_z + (a * d_z + h * d_x) / d)
+
+
+def piston_positions(crank_angles, dims=DEFAULT_DIMENSIONS):
+    """
+    Slider-crank piston position, as reported by Constraint019
+    :param crank_angles: array of crank angles in degrees
+    :return: array of piston positions, same shape as crank_angles
+    """
+    alpha = crank_direction(crank_angles)
+    r = dims.crank_radius
+    pin_x = r * np.cos(alpha) - np.sqrt(dims.rod_length ** 2 -
+                                        (r * np.sin(alpha)) ** 2)
+    return (dims.piston_mark + pin_x - dims.piston_rod -
+            dims.piston_half_width)
+
+
+def link_positions(crank_angles, cutoff_angles, dims=DEFAULT_DIMENSIONS):
+    """
+    Eccentric rod end and valve positions for every combination of cutoff and
+    crank angle. Poses the linkage cannot reach come back as NaN.
+    :param crank_angles: 1-D array of crank angles in degrees
+    :param cutoff_angles: 1-D array of radius link angles in degrees
+    :return: valve, ecc_z, ecc_x - arrays of shape (cutoffs, crank angles)
+    """
+    alpha = crank_direction(crank_angles)[np.newaxis, :]
+    phi = np.radians(np.asarray(cutoff_angles, dtype=float))[:, np.newaxis]
+
+    # Eccentric centre - Sketch001's angle datum is on the line from it to
+    # the crank centre
+    ecc = alpha + np.radians(dims.eccentric_angle - 180)
+    e_x = dims.eccentric_radius * np.cos(ecc)
+    e_z = dims.eccentric_radius * np.sin(ecc)
+
+    # Centre of the radius link arc, which passes through the reverser pivot
+    c_x = dims.reverser_pivot_x + dims.radius_link * np.cos(phi)
+    c_z = dims.reverser_pivot_z + dims.radius_link * np.sin(phi)
+
+    # Die block - on the radius link arc, at a fixed distance from the
+    # eccentric centre
+    die = np.hypot(dims.die_pin, dims.die_offset)
+    d_x, d_z = intersect(e_x, e_z, die, c_x, c_z, dims.radius_link, 1)
+    # Eccentric rod centre line, turned back from the die block's offset
+    rod = (np.arctan2(d_z - e_z, d_x - e_x) -
+           np.arctan2(dims.die_offset, dims.die_pin))
+    length = dims.die_pin + dims.eccentric_rod_end
+    ecc_x = e_x + length * np.cos(rod)
+    ecc_z = e_z + length * np.sin(rod)
+
+    # Lifting link up to the rocking lever input arm
+    p_x = dims.reverser_pivot_x - dims.rocker_pivot_dx
+    p_z = dims.rocker_pivot_z
+    i_x, i_z = intersect(ecc_x, ecc_z, dims.lifting_link, p_x, p_z,
+                         dims.rocker_arm, -1)
+    out = np.arctan2(i_z - p_z, i_x - p_x) + np.radians(dims.rocker_angle)
+    o_x = p_x + dims.rocker_arm * np.cos(out)
+    o_z = p_z + dims.rocker_arm * np.sin(out)
+
+    # Valve link down to the valve pin on the valve line, cylinder side
+    with np.errstate(invalid='ignore'):
+        v_x = o_x - np.sqrt(dims.valve_link ** 2 -
+                            (dims.valve_line - o_z) ** 2)
+    return dims.valve_rod - v_x, ecc_z, ecc_x
+
+
+def sweep(crank_angles, cutoff_angles, dims=DEFAULT_DIMENSIONS):
+    """
+    Solves the whole (cutoff angle x crank angle) grid in one call
+    :param crank_angles: 1-D array of crank angles in degrees
+    :param cutoff_angles: 1-D array of radius link angles in degrees
+    :return: KinematicSweep
+    """
+    crank = np.asarray(crank_angles, dtype=float)
+    cutoffs = np.atleast_1d(np.asarray(cutoff_angles, dtype=float))
+    valve, ecc_z, ecc_x = link_positions(crank, cutoffs, dims)
+    return KinematicSweep(crank, cutoffs, piston_positions(crank, dims),
+                          valve, ecc_z, ecc_x)
+
+
+def check(dims=DEFAULT_DIMENSIONS, reference=REFERENCE):
+    """
+    Compares the model with a pose measured in FreeCAD
+    :param reference: dict of crank, cutoff and the measured piston, valve,
+    ecc_x and ecc_z, see REFERENCE
+    :return: {measurement: model - FreeCAD}
+    """
+    result = sweep([reference['crank']], [reference['cutoff']], dims)
+    model = {'piston': result.piston[0], 'valve': result.valve[0, 0],
+             'ecc_x': result.ecc_x[0, 0], 'ecc_z': result.ecc_z[0, 0]}
+    return {name: model[name] - reference[name] for name in model}
+
+
+def to_results(result, dims=DEFAULT_DIMENSIONS):
+    """
+    :param result: KinematicSweep
+    :return: ResultsFile.Results
+    """
+    header = ResultsFile.make_header(result.cutoffs,
+                                     model='analytic ' + repr(tuple(dims)))
+    return ResultsFile.Results(result.crank, result.piston, result.valve,
+                               result.ecc_z, result.ecc_x, header)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Firth valve gear sweep from the closed-form model')
+    parser.add_argument('output', help='.npz results file, or .csv export')
+    parser.add_argument('cutoffs', nargs='*', type=float,
+                        default=[75, 90, 115],
+                        help='radius link angles (default fwd, mid, rev)')
+    parser.add_argument('--step', type=float, default=10,
+                        help='crank angle step in degrees')
+    parser.add_argument('--model', help='.FCStd to take the dimensions '
+                                        'from and check against (see '
+                                        'FCStdReader)')
+    parser.add_argument('--tolerance', type=float, default=1e-3,
+                        help='largest allowed difference from the pose '
+                             'measured in FreeCAD, mm')
+    args = parser.parse_args()
+    dims, pose = DEFAULT_DIMENSIONS, REFERENCE
+    if args.model:
+        import FCStdReader
+        model = FCStdReader.load_model(args.model)
+        dims = dims._replace(**FCStdReader.dimensions(model))
+        pose = FCStdReader.reference(model)
+    errors = check(dims, pose)
+    for name, error in sorted(errors.items()):
+        print('CHECK {} {:+.6f}'.format(name.upper(), error))
+    if max(abs(e) for e in errors.values()) > args.tolerance:
+        raise SystemExit('MODEL DOES NOT MATCH THE FREECAD POSE')
+    crank = np.arange(0, 360 + args.step, args.step)
+    results = to_results(sweep(crank, args.cutoffs, dims), dims)
+    if args.output.endswith('.csv'):
+        ResultsFile.export_csv(args.output, results)
+    else:
+        ResultsFile.save(args.output, results,
+                         Harmonics.for_results(results))
+    print("FILE WRITTEN", args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,22 @@
 #! python
 # -*- coding: utf-8 -*-
-import time
-import csv
 import os
 from PyQt5 import QtGui, QtCore
-from PyQt5.QtWidgets import QDialog, QLabel, QSlider, QLineEdit, QPushButton
+from PyQt5.QtWidgets import QDialog, QLabel, QSlider, QLineEdit, \
+    QPushButton, QCheckBox
+from AdaptiveSampling import adaptive_angles
+from ContinuationSolver import ContinuationSolver
+from PoseCache import PoseCache, model_hash
+from Playback import MotionPlayer
+from Profiler import Profiler
+import numpy as np
+import FCStdReader
+import FirthKinematics
+import Harmonics
+import InverseCutoff
+import Measurement
+import ResultsFile
+from SweepJournal import SweepJournal
 
 
 class ControlPanel(QDialog):
@@ -23,6 +35,15 @@ class ControlPanel(QDialog):
         self.end_value = 359.999
         self.unit_suffix = (" °")
         self.result = ""
+        self.crank_step = 10
+        # Radius link angle last set by set_cutoff()
+        self.cutoff = None
+        # Journal part file the current run appends its poses to
+        self.journal = None
+        self.profiler = Profiler()
+        self.cache = PoseCache.for_model(document)
+        self.player = MotionPlayer(document, self.actuator)
+        self.player.frame_shown.connect(self.on_frame)
         self.setMaximumWidth(400)
         # self.setMaximumHeight(200)
         self.setMinimumWidth(400)
@@ -40,6 +61,14 @@ class ControlPanel(QDialog):
         self.actuator_slider.setValue(
             int(self.current_value / self.step_ratio()))
         self.actuator_slider.valueChanged.connect(self.on_actuator_slider)
+        self.actuator_slider.sliderReleased.connect(self.on_slider_released)
+
+        # Slider moves are coalesced - only the latest target is shown
+        self.slider_target = None
+        self.slider_timer = QtCore.QTimer(self)
+        self.slider_timer.setSingleShot(True)
+        self.slider_timer.setInterval(20)
+        self.slider_timer.timeout.connect(self.on_slider_timer)
 
         # Slider label
         self.label_current = QLabel("", self)
@@ -66,7 +95,11 @@ class ControlPanel(QDialog):
         self.cutoff_ctrl = QLineEdit(self)
         self.cutoff_ctrl.setGeometry(170, 105, 50, 25)
         self.cutoff_ctrl.returnPressed.connect \
-            (lambda: self.set_cutoff(int(self.cutoff_ctrl.text())))
+            (lambda: self.set_cutoff(self.cutoff_ctrl.text()))
+
+        # Piston and valve position readout
+        self.label_positions = QLabel("", self)
+        self.label_positions.setGeometry(QtCore.QRect(230, 105, 150, 25))
 
         # File name input
         self.output_file_input = QLineEdit(self)
@@ -100,21 +133,83 @@ class ControlPanel(QDialog):
         self.button_run.setGeometry(QtCore.QRect(150, 210, 100, 25))
         self.button_run.pressed.connect(self.run)
 
-        self.button_test = QPushButton("Test", self)
+        self.button_test = QPushButton("Play", self)
         self.button_test.setGeometry(QtCore.QRect(150, 245, 100, 25))
         self.button_test.pressed.connect(self.test)
 
+        # Playback speed, crank degrees per second, and looping
+        self.speed_input = QLineEdit(self)
+        self.speed_input.setText('90')
+        self.speed_input.setGeometry(100, 280, 50, 25)
+        self.speed_input.returnPressed.connect(self.set_speed)
+
+        self.loop_check = QCheckBox("Loop", self)
+        self.loop_check.setChecked(True)
+        self.loop_check.setGeometry(QtCore.QRect(260, 280, 100, 25))
+        self.loop_check.toggled.connect(self.player.set_loop)
+
+        # Target cutoff, % of stroke - Find sets the fwd and rev angles
+        self.target_input = QLineEdit(self)
+        self.target_input.setText('50')
+        self.target_input.setGeometry(100, 315, 50, 25)
+
+        self.button_find = QPushButton("Find", self)
+        self.button_find.setGeometry(QtCore.QRect(150, 315, 100, 25))
+        self.button_find.pressed.connect(self.find_cutoffs)
+
+        # Refine crank angles around valve events instead of fixed steps
+        self.adaptive_check = QCheckBox("Adaptive", self)
+        self.adaptive_check.setGeometry(QtCore.QRect(260, 210, 100, 25))
+
+        # Follow the linkage with ContinuationSolver, solving the assembly
+        # only where it needs to
+        self.continuation_check = QCheckBox("Continuation", self)
+        self.continuation_check.setGeometry(QtCore.QRect(35, 210, 110, 25))
+
+        # Also export the results as .csv
+        self.csv_check = QCheckBox("Export CSV", self)
+        self.csv_check.setGeometry(QtCore.QRect(260, 245, 100, 25))
+
+        # Write a Chrome trace of the run's phase timings
+        self.trace_check = QCheckBox("Trace", self)
+        self.trace_check.setGeometry(QtCore.QRect(35, 245, 100, 25))
+
         self.show()
 
+    def crank_angles(self):
+        """Uniform crank angles from 0 to 360 inclusive"""
+        return list(range(0, 360 + self.crank_step, self.crank_step))
+
     def test(self):
+        """
+        Plays or pauses the motion. Poses are solved once for the current
+        cutoff, then replayed from the cached placements.
+        """
         try:
-            for angle in range(0, 370, 10):
-                self.actuator.Angle = angle
-                Gui.runCommand("asm3CmdQuickSolve", 0)
-                time.sleep(1)
+            if self.player.is_playing():
+                self.player.pause()
+                self.button_test.setText("Play")
+                return
+            if self.player.is_stale(self.cutoff):
+                self.player.precompute(self.crank_angles(), self.cutoff)
+            self.set_speed()
+            self.player.play()
+            self.button_test.setText("Pause")
         except:
             print('test failed')
 
+    def set_speed(self):
+        try:
+            self.player.set_speed(float(self.speed_input.text()))
+        except ValueError:
+            print('Exception @ set_speed()')
+
+    def on_frame(self, angle):
+        self.current_value = angle
+        self.label_current.setText(str(round(angle, 1)) + self.unit_suffix)
+        if not self.player.is_playing():
+            self.button_test.setText("Play")
+
     def jog_back(self):
         self.current_value = self.current_value - 10
         self.actuator.Angle = self.current_value
@@ -167,135 +262,338 @@ class ControlPanel(QDialog):
     def on_actuator_slider(self, slider_value):
         self.current_value = slider_value * self.step_ratio() + \
                              self.start_value
-        self.actuator.Angle = self.current_value
         self.label_current.setText(str(round(self.current_value, 1)) +
                                    self.unit_suffix)
         self.angle_input.setText(str(round(self.current_value, 1)))
+        self.slider_target = self.current_value
+        self.slider_timer.start()
+
+    def on_slider_timer(self):
+        """
+        Latest slider target - previewed while it's being dragged, solved
+        exactly otherwise
+        """
+        if self.actuator_slider.isSliderDown():
+            self.preview(self.slider_target)
+        else:
+            self.solve(self.slider_target)
+
+    def on_slider_released(self):
+        self.slider_timer.stop()
+        self.solve(self.slider_target)
+
+    def preview(self, angle):
+        """
+        Shows the crank angle without solving - placements blended from the
+        playback frames and positions interpolated from the pose cache,
+        where they're available for the current cutoff
+        """
+        if not self.player.is_stale(self.cutoff):
+            self.player.show_frame(angle)
+        if self.cutoff is None:
+            return
+        below, above = self.cache.nearest(self.cutoff, angle)
+        if below is None or above is None:
+            return
+        fraction = (angle - below[0]) / (above[0] - below[0])
+        low = np.array(Measurement.as_floats(below[1]))
+        high = np.array(Measurement.as_floats(above[1]))
+        ppos, vpos = ((1 - fraction) * low + fraction * high)[:2]
+        self.show_positions(ppos, vpos)
+
+    def solve(self, angle):
+        """Exact solve at the crank angle"""
+        if angle is None:
+            return
+        self.actuator.Angle = angle
         Gui.runCommand("asm3CmdQuickSolve", 0)
+        positions = self.get_current_positions()
+        if positions:
+            self.show_positions(*positions[1:])
+
+    def show_positions(self, ppos, vpos):
+        self.label_positions.setText('P {:.3f}  V {:.3f}'.format(ppos, vpos))
 
     def run(self):
+        """
+        Every pose is journalled as it is solved (see SweepJournal), so a
+        failed run keeps what it had solved; run again and the pose cache
+        skips those poses.
+        """
         print("RUN")
-        crank_angles = []
-        piston_posns = []
-        fwd_posns = []
-        mid_posns = []
-        rev_posns = []
-        ecc_fwd = ['']
-        ecc_mid = ['']
-        ecc_rev = ['']
-        cutoffs = [[self.fwd_angle, fwd_posns, ecc_fwd],
-                   [self.mid_angle, mid_posns, ecc_mid],
-                   [self.rev_angle, rev_posns, ecc_rev]]
-        for angle in range(0, 370, 10):
-            crank_angles.append(angle)
-        piston_posns = self.get_piston_positions(piston_posns)
-        print("TRYING CUTOFF AT ANGLE", angle)
+        cutoffs = [self.fwd_angle, self.mid_angle, self.rev_angle]
+        self.profiler.reset()
         try:
-            for cutoff in cutoffs:
-                # print('SETTING CUTOFF')
-                self.set_cutoff(cutoff[0])
-                print('USING CUTOFF', cutoff)
-                self.use_selected_cutoff(cutoff[1], cutoff[2])
-                # print('CUTOFF LINE 199', cutoff[2])
-            posns = zip(crank_angles, piston_posns, fwd_posns, mid_posns,
-                        rev_posns, ecc_fwd, ecc_mid, ecc_rev)
-            self.write_file(posns)
+            self.refresh_model()
+            if self.adaptive_check.isChecked():
+                crank_angles = self.adaptive_crank_angles(cutoffs)
+            else:
+                crank_angles = self.crank_angles()
+            journal = SweepJournal(self.output_path() + '.npz', cutoffs,
+                                   crank_angles, self.cache.model)
+            self.journal = journal.writer()
+            try:
+                if self.continuation_check.isChecked():
+                    buffer = self.continuation_sweep(cutoffs, crank_angles)
+                else:
+                    buffer = self.sweep(cutoffs, crank_angles)
+            finally:
+                self.journal.close()
+                self.journal = None
+            if not buffer.is_complete():
+                raise RuntimeError('sweep incomplete')
+            header = ResultsFile.make_header(cutoffs, model=self.cache.model)
+            self.write_file(buffer.results(header))
+            journal.complete()
         except:
             print('RUN FAILED')
+            self.profiler.count('run_failed')
+        self.profiler.print_summary()
+        if self.trace_check.isChecked():
+            self.profiler.chrome_trace(self.output_path() + '_trace.json')
+
+    def refresh_model(self):
+        """
+        Re-keys the pose cache on the document as it is now, so poses solved
+        before an edit - saved or not - aren't reused
+        """
+        with self.profiler.phase('model_hash'):
+            self.cache.use_model(model_hash(self.doc))
 
-    def get_piston_positions(self, posns):
+    def sweep(self, cutoffs, crank_angles):
+        """
+        Single pass sweep - every pose is solved once and piston, valve and
+        eccentric rod end positions are all read after the same solve.
+        Repeated cutoffs are solved once, and the cutoff already set in the
+        model is used first, so set_cutoff() recomputes the document as few
+        times as possible.
+        :param cutoffs: radius link angles, in output row order
+        :param crank_angles: crank angles to solve at
+        :return: Measurement.SweepBuffer, NaN where a pose failed
+        """
+        distinct = sorted(set(cutoffs), key=float)
+        if self.cutoff in distinct:
+            distinct.remove(self.cutoff)
+            distinct.insert(0, self.cutoff)
+        buffer = Measurement.SweepBuffer(cutoffs, crank_angles)
+        for cutoff in distinct:
+            print('USING CUTOFF', cutoff)
+            poses = self.use_selected_cutoff(cutoff, crank_angles)
+            for row, c in enumerate(cutoffs):
+                if c == cutoff:
+                    buffer.put(row, poses)
+        return buffer
+
+    def continuation_sweep(self, cutoffs, crank_angles):
+        """
+        Sweep by ContinuationSolver, with the linkage dimensions read from
+        the document. Only its first poses, and any Newton can't follow, are
+        solved in the assembly (see use_selected_cutoff()).
+        :param cutoffs: radius link angles, in output row order
+        :param crank_angles: crank angles to solve at, in order
+        :return: Measurement.SweepBuffer, NaN where a pose can't be reached
+        """
+        profiler = self.profiler
+        with profiler.phase('read_dimensions'):
+            dims = FirthKinematics.DEFAULT_DIMENSIONS._replace(
+                **FCStdReader.dimensions(FCStdReader.read_document(self.doc)))
+        labels = {float(c): c for c in cutoffs}
+        distinct = sorted(labels)
+
+        def assembly(cutoffs, crank_angle):
+            profiler.count('continuation_fallback', len(cutoffs))
+            poses = np.array([self.use_selected_cutoff(
+                labels[c], [crank_angle])[0] for c in cutoffs])
+            return poses[:, 1], poses[:, 2], poses[:, 3]
+
+        solver = ContinuationSolver(distinct, assembly, dims)
+        result = solver.sweep(crank_angles)
+        profiler.count('branch_flip', int(result.flipped.sum()))
+        profiler.count('unreachable', int(result.unreachable.sum()))
+        for j, cutoff in enumerate(distinct):
+            for angle in result.sweep.crank[result.flipped[j]]:
+                print('BRANCH FLIP', labels[cutoff], angle)
+        sweep = result.sweep
+        buffer = Measurement.SweepBuffer(cutoffs, crank_angles)
+        for row, c in enumerate(cutoffs):
+            j = distinct.index(float(c))
+            buffer.put(row, np.column_stack([sweep.piston, sweep.valve[j],
+                                             sweep.ecc_z[j], sweep.ecc_x[j]]))
+        return buffer
+
+    def adaptive_crank_angles(self, cutoffs):
+        """
+        Refines the crank angles separately for each cutoff around its valve
+        events, then returns the union so every cutoff can be written on
+        the same rows. The poses solved while refining are in the pose
+        cache, so the final sweep only solves the angles other cutoffs
+        needed.
+        :param cutoffs: radius link angles
+        :return: sorted crank angles
         """
-        Gets piston position for each crank angle setting
-        :param posns: Position list
-        :return: List of position lists
+        crank_angles = set()
+        for cutoff in sorted(set(cutoffs), key=float):
+            def measure(angles):
+                return self.use_selected_cutoff(cutoff, angles)[:, 1]
+            angles, _ = adaptive_angles(measure, step=self.crank_step)
+            crank_angles.update(angles)
+        return sorted(crank_angles)
+
+    def find_cutoffs(self):
+        """
+        Radius link angles for the target cutoff in forward and reverse
+        gear, solved in the assembly (see InverseCutoff), into the fwd and
+        rev inputs
         """
         try:
-            for angle in range(0, 370, 10):
-                self.actuator.Angle = angle
-                Gui.runCommand("asm3CmdQuickSolve", 0)
-                ppos = App.ActiveDocument.Constraint019.Label2
-                posns.append(ppos)
-        except:
-            print("get_piston_positions failed")
-        return posns
+            target = float(self.target_input.text())
+            mid = float(self.mid_angle)
+        except ValueError:
+            print('Exception @ find_cutoffs()')
+            return
+        self.profiler.reset()
+        self.refresh_model()
+        results = InverseCutoff.find_cutoffs(self.measure, target, target,
+                                             mid=mid)
+        for name, result, field in zip(('FWD', 'REV'), results,
+                                       (self.fwd_angle_input,
+                                        self.rev_angle_input)):
+            if isinstance(result, ValueError):
+                print(name, 'NOT FOUND -', result)
+                continue
+            print(name, 'ANGLE {angle:.3f} CUTOFF AT {event:.2f} DEG, '
+                        '{percent:.2f}% ({solves} SOLVES)'.format(**result))
+            field.setText('{:.3f}'.format(result['angle']))
+        self.profiler.print_summary()
+
+    def measure(self, cutoff, crank_angles):
+        """
+        Piston and valve positions, for InverseCutoff
+        :param cutoff: radius link angle, number
+        :param crank_angles: crank angles to solve at
+        :return: piston positions, valve positions
+        """
+        poses = self.use_selected_cutoff('{:.3f}'.format(cutoff),
+                                         crank_angles)
+        return poses[:, 0], poses[:, 1]
 
-    def use_selected_cutoff(self, posns, eccs):
+    def use_selected_cutoff(self, cutoff, crank_angles):
         """
-        Gets valve and eccentric rod end positions for the selected cutoff
-        :param posns: Valve position list for the selected cutoff, eccs:
-        eccentric rod end position list
-        :return: valve positions
+        Gets piston, valve and eccentric rod end positions for the selected
+        cutoff. Poses in the pose cache are not solved again, and the cutoff
+        is only set in the model if at least one pose has to be solved.
+        :param cutoff: radius link angle
+        :param crank_angles: crank angles to solve at
+        :return: (n, 4) array of piston, valve, eccentric z and eccentric x
+        for each crank angle, NaN from any pose that failed on
         """
+        profiler = self.profiler
+        poses = np.full((len(crank_angles), len(Measurement.CHANNELS)),
+                        np.nan)
         try:
-            for angle in range(0, 370, 10):
-                # n.b. add 10 to desired upper range value
-                row = []
-                self.actuator.Angle = angle
-                Gui.runCommand("asm3CmdQuickSolve", 0)
-                vpos = App.ActiveDocument.Constraint020.Label2
-                eccpos_x = App.ActiveDocument.Constraint021.Label2
-                eccpos_z = App.ActiveDocument.Constraint022.Label2
-                eccpos = [eccpos_z, eccpos_x]
-                # print("ANGLE", angle)
-                # print("ECCENTRIC POSNS", vpos, eccpos)
-                posns.append(vpos)
-                eccs.append(eccpos)
+            for i, angle in enumerate(crank_angles):
+                with profiler.phase('cache_get', cutoff=cutoff, angle=angle):
+                    pose = self.cache.get(cutoff, angle)
+                if pose is None:
+                    if not self.set_cutoff(cutoff):
+                        raise RuntimeError('cutoff not set')
+                    self.actuator.Angle = angle
+                    with profiler.phase('solve', cutoff=cutoff, angle=angle):
+                        Gui.runCommand("asm3CmdQuickSolve", 0)
+                    with profiler.phase('read', cutoff=cutoff, angle=angle):
+                        pose = Measurement.measure(App.ActiveDocument)
+                    self.cache.put(cutoff, angle, pose)
+                else:
+                    profiler.count('cache_hit')
+                    pose = Measurement.as_floats(pose)
+                if self.journal is not None:
+                    with profiler.phase('journal', cutoff=cutoff):
+                        self.journal.write([cutoff, angle] + list(pose))
+                poses[i] = pose
         except:
             print("RUN() EXCEPTION")
-        return posns, eccs
+            profiler.count('solve_failed')
+        with profiler.phase('cache_commit', cutoff=cutoff):
+            self.cache.commit()
+        return poses
 
     def set_cutoff(self, angle):
+        """
+        Sets the radius link angle, Sketch004 datum 5, trying twice
+        :param angle: radius link angle, str
+        :return: True if the model is at angle. If not, the cutoff it's at
+        isn't known either and self.cutoff is None
+        """
         print('SET_CUTOFF ENTERED', angle)
+        if angle == self.cutoff:
+            return True
+        profiler = self.profiler
         try:
             # print('TRYING')
-            App.ActiveDocument.getObject('Sketch004'). \
-                setDatum(5, App.Units.Quantity(angle + ' deg'))
-            App.ActiveDocument.recompute()
+            with profiler.phase('recompute', cutoff=angle):
+                App.ActiveDocument.getObject('Sketch004'). \
+                    setDatum(5, App.Units.Quantity(angle + ' deg'))
+                App.ActiveDocument.recompute()
             # print('SET CUTOFF', App.ActiveDocument.getObject('Sketch004').
             #      getDatum(5, App.Units.Quantity))
+            self.cutoff = angle
+            return True
         except:
             print('SETTING CUTOFF FAILED - TRY AGAIN')
+            profiler.count('set_cutoff_retry')
             try:
                 print('TRYING')
-                App.ActiveDocument.getObject('Sketch004'). \
-                    setDatum(5, App.Units.Quantity(angle + ' deg'))
-                App.ActiveDocument.recompute()
+                with profiler.phase('recompute', cutoff=angle, retry=True):
+                    App.ActiveDocument.getObject('Sketch004'). \
+                        setDatum(5, App.Units.Quantity(angle + ' deg'))
+                    App.ActiveDocument.recompute()
             except:
                 print('SETTING CUTOFF FAILED')
+                profiler.count('set_cutoff_failed')
+                self.cutoff = None
+                return False
+        self.cutoff = angle
+        return True
 
     def get_current_positions(self):
         """Get distance (vpos) of valve mid point from cylinder mid point at
-        current crank angle (cpos). The MeasurePoints Label2 gives the
-        distance rounded to 2 decimal places.
+        current crank angle (cpos), and piston position (ppos), as floats at
+        full precision - see Measurement.
         """
         try:
             cpos = self.actuator.Angle
-            ppos = App.ActiveDocument.Constraint019.Label2
-            vpos = App.ActiveDocument.Constraint020.Label2
+            ppos, vpos = Measurement.measure(App.ActiveDocument)[:2]
             return cpos, ppos, vpos
         except:
             print("exception - get_current_pos()")
             # return 0, 0, 0
 
-    def write_file(self, posns):
+    def write_file(self, results):
         """
+        Writes the run as .npz, and as .csv too if Export CSV is checked.
         n.b. Hard coded path
-        :param posns:
+        :param results: ResultsFile.Results
         :return:
         """
-        print("WRITING FILE", posns)
+        f = self.output_path()
+        with self.profiler.phase('write_file'):
+            ResultsFile.save(f + '.npz', results,
+                             Harmonics.for_results(results))
+        print("FILE WRITTEN", f + '.npz')
+        if self.csv_check.isChecked():
+            with self.profiler.phase('write_csv'):
+                ResultsFile.export_csv(f + '.csv', results)
+            print("FILE WRITTEN", f + '.csv')
+
+    def output_path(self):
+        """Output file, without extension. n.b. Hard coded path"""
         fname = self.output_file_input.text()
-        f = '/home/andy/Projects/Mechanical/Z7S/ValveGear/Results/' + \
-            fname + '.csv'
-        with open(f, 'w') as csv_file:
-            writer = csv.writer(csv_file, quoting=csv.QUOTE_NONNUMERIC)
-            print(writer)
-            for row in posns:
-                writer.writerow(row)
-        print("FILE WRITTEN", f)
+        return '/home/andy/Projects/Mechanical/Z7S/ValveGear/Results/' + fname
 
     def on_close(self):
         self.result = "Closed"
+        self.player.pause()
+        self.cache.close()
         self.close()
 
 
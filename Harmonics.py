@@ -0,0 +1,128 @@
+#! python
+# -*- coding: utf-8 -*-
+"""
+Fourier series fit of crank angle curves.
+
+Piston and valve motion are periodic in crank angle, so each curve is
+reduced by FFT to its first N harmonics,
+    y(theta) = Re sum_n A_n exp(i n theta),   n = 0 .. N
+taking the fewest harmonics that reproduce every sample to within a
+tolerance. Values, velocities and accelerations (per crank degree) can then
+be evaluated at any angles, for any number of curves, as one matrix
+product - many designs can be kept in memory and compared cheaply.
+
+The coefficients are stored in the run's .npz (see ResultsFile.save).
+"""
+from collections import namedtuple
+import numpy as np
+import ResultsFile
+from Smoothing import fit as spline_fit, PERIOD
+
+HarmonicFit = namedtuple('HarmonicFit', ['coefficients', 'residual'])
+
+
+def uniform(x_val, y_val, samples=None):
+    """
+    Samples over [0, 360) at even spacing - as given if they already are,
+    otherwise resampled from a periodic spline
+    :return: (m,) angles, (..., m) values
+    """
+    x_val = np.asarray(x_val, dtype=float)
+    y_val = np.asarray(y_val, dtype=float)
+    step = np.diff(x_val)
+    if samples is None and x_val[-1] - x_val[0] == PERIOD and \
+            np.allclose(step, step[0]):
+        return x_val[:-1], y_val[..., :-1]
+    m = samples or 360
+    x_new = x_val[0] + np.arange(m) * PERIOD / m
+    return x_new, spline_fit(x_val, y_val)(x_new)
+
+
+def basis(angles, harmonics, derivative=0):
+    """(n + 1, m) terms (i n)^d exp(i n theta), derivatives per degree"""
+    theta = np.radians(np.asarray(angles, dtype=float))
+    n = np.arange(harmonics + 1)[:, np.newaxis]
+    scale = (1j * n * np.pi / 180) ** derivative
+    return scale * np.exp(1j * n * theta)
+
+
+def evaluate(harmonic_fit, angles, derivative=0):
+    """
+    :param harmonic_fit: HarmonicFit, or its coefficients
+    :param angles: crank angle or array of them, degrees
+    :param derivative: 0 for values, 1 velocity, 2 acceleration - per crank
+    degree
+    :return: (curves, angles) values, or (angles,) for a single curve
+    """
+    coefficients = getattr(harmonic_fit, 'coefficients', harmonic_fit)
+    angles = np.atleast_1d(angles)
+    return (coefficients @ basis(angles, coefficients.shape[-1] - 1,
+                                 derivative)).real
+
+
+def fit(x_val, y_val, harmonics=None, tolerance=0.01, samples=None):
+    """
+    :param x_val: (n,) crank angles in degrees, 0 - 360
+    :param y_val: (n,) or (k, n) - one row per curve
+    :param harmonics: number of harmonics to keep, or None for the fewest
+    that keep every residual within tolerance - if no number does, the most
+    that can be represented are kept and a warning printed, and the curves
+    that miss are those with a residual over tolerance
+    :param tolerance: largest allowed difference from the samples, mm
+    :return: HarmonicFit - (..., N + 1) complex coefficients and each curve's
+    largest residual at the given samples
+    """
+    x_val = np.asarray(x_val, dtype=float)
+    y_val = np.asarray(y_val, dtype=float)
+    angles, values = uniform(x_val, y_val, samples)
+    m = values.shape[-1]
+    spectrum = np.fft.rfft(values, axis=-1) / m
+    # One-sided amplitudes; the Nyquist term, if any, can't be represented
+    spectrum[..., 1:] *= 2
+    spectrum *= np.exp(-1j * np.arange(spectrum.shape[-1]) *
+                       np.radians(angles[0]))
+    limit = (m - 1) // 2
+    candidates = [harmonics] if harmonics else range(1, limit + 1)
+    for n in candidates:
+        coefficients = spectrum[..., :n + 1]
+        residual = np.abs(evaluate(coefficients, x_val) - y_val).max(axis=-1)
+        if np.all(residual <= tolerance):
+            break
+    else:
+        if harmonics is None:
+            print('HARMONIC FIT OUTSIDE TOLERANCE', tolerance,
+                  'WITH', n, 'HARMONICS, LARGEST RESIDUAL',
+                  '{:.4g}'.format(np.max(residual)))
+    return HarmonicFit(coefficients, residual)
+
+
+def fit_results(results, harmonics=None, tolerance=0.01):
+    """
+    Fits the piston and every valve row of a run
+    :param results: ResultsFile.Results
+    :return: HarmonicFit, piston first then the valve rows
+    """
+    return fit(results.crank, np.vstack([results.piston, results.valve]),
+               harmonics, tolerance)
+
+
+def for_results(results, tolerance=0.01):
+    """
+    :return: HarmonicFit to save with a run, None if it isn't a full cycle
+    """
+    if results.crank[-1] - results.crank[0] != PERIOD:
+        return None
+    return fit_results(results, tolerance=tolerance)
+
+
+def load(fname):
+    """
+    Coefficients stored with a run, fitted now if it hasn't any
+    :return: HarmonicFit, piston first then the valve rows
+    """
+    if str(fname).endswith('.npz'):
+        with np.load(fname) as data:
+            if 'harmonics' in data:
+                return HarmonicFit(data['harmonics'],
+                                   data['harmonics_residual'])
+    return fit_results(ResultsFile.load(fname))
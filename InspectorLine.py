@@ -1,46 +1,87 @@
-from PyQt5 import Qt
-from pyqtgraph import InfiniteLine, TextItem
+from PyQt5.QtGui import QGuiApplication
+from pyqtgraph import InfiniteLine, TextItem, SignalProxy
 import numpy as np
-from datetime import date
+from weakref import WeakKeyDictionary
 
 
 class InspectorLine(InfiniteLine):
+    """
+    Movable line that labels the points of every curve it touches. angle=90
+    gives a vertical line reading x, angle=0 a horizontal one reading y.
+    Curve coordinates are sorted once and cached, so each move is a
+    searchsorted per curve, labels come from a pool of TextItems that are
+    moved rather than recreated, and updates are limited to the display
+    refresh rate.
+    """
 
-    def __init__(self, ):
-        super(InspectorLine, self).__init__(angle=90, movable=True)
+    def __init__(self, angle=90):
+        super(InspectorLine, self).__init__(angle=angle, movable=True)
+        # 0 if the line sits at an x value, 1 if at a y value
+        self._axis = 0 if angle == 90 else 1
         self._labels = []
         self._plot_item = None
-        self.sigPositionChanged.connect(self._onMoved)
+        # curve -> (coordinate array, sorted coordinates, sort order)
+        self._index = WeakKeyDictionary()
+        screen = QGuiApplication.primaryScreen()
+        rate = screen.refreshRate() if screen is not None else 60
+        self._proxy = SignalProxy(self.sigPositionChanged, rateLimit=rate,
+                                  slot=self._onMoved)
 
-    def _onMoved(self):
-        x_px_size, _ = self.getViewBox().viewPixelSize()
-        inspector_x = self.value()
-        self._removeLabels()
+    def _onMoved(self, *args):
+        px_size = self.getViewBox().viewPixelSize()[self._axis]
+        inspector_pos = self.value()
         points = []
 
         # iterate over the existing curves
         for c in self._plot_item.curves:
-
-            # find the index of the closest point of this curve
-            adiff = np.abs(c.xData - inspector_x)
-            idx = np.argmin(adiff)
+            data = c.xData if self._axis == 0 else c.yData
+            if data is None or len(data) == 0:
+                continue
+            idx, dist = self._closest(c, data, inspector_pos)
 
             # only add a label if the line touches the symbol
-            tolerance = .5 * max(1, c.opts['symbolSize']) * x_px_size
-            if adiff[idx] < tolerance:
+            tolerance = .5 * max(1, c.opts['symbolSize']) * px_size
+            if dist < tolerance:
                 points.append((c.xData[idx], c.yData[idx]))
 
         self._createLabels(points)
 
+    def _closest(self, curve, data, pos):
+        """
+        :return: index of the point of curve closest to pos, and its distance
+        """
+        entry = self._index.get(curve)
+        if entry is None or entry[0] is not data:
+            if np.all(np.diff(data) >= 0):
+                order = None
+                coords = data
+            else:
+                # Non-monotonic, e.g. the eccentric rod end path
+                order = np.argsort(data, kind='stable')
+                coords = data[order]
+            entry = (data, coords, order)
+            self._index[curve] = entry
+        _, coords, order = entry
+        i = np.searchsorted(coords, pos)
+        i = np.clip([i - 1, i], 0, len(coords) - 1)
+        dists = np.abs(coords[i] - pos)
+        i = i[np.argmin(dists)]
+        return (i if order is None else order[i]), dists.min()
+
     def _createLabels(self, points):
-        for x, y in points:
+        for i, (x, y) in enumerate(points):
+            if i == len(self._labels):
+                text_item = TextItem()
+                self._labels.append(text_item)
+                self._plot_item.addItem(text_item)
+            text_item = self._labels[i]
             x = round(x, 2)
             y = round(y, 2)
-            text = 'x={}, y={}'.format(x, y)
-            text_item = TextItem(text=text)
+            text_item.setText('x={}, y={}'.format(x, y))
             text_item.setPos(x, y)
-            self._labels.append(text_item)
-            self._plot_item.addItem(text_item)
+            text_item.show()
+        for text_item in self._labels[len(points):]:
+            text_item.hide()
 
     def _removeLabels(self):
         # remove existing texts
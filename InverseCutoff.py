@@ -0,0 +1,295 @@
+#!/usr/bin/python3.6
+"""
+Inverse cutoff solve - finds the radius link angle (Sketch004 datum 5) that
+gives a requested cutoff, as % of piston stroke, timed as ValveEvents times
+it: the first crossing of the steam lap in the direction the engine runs.
+
+The cutoff percentage is sampled at a few radius link angles from full gear
+towards mid gear, which gives the reachable range and a narrow bracket, and
+the angle is then found by Brent's method. Each evaluation finds the crank
+angle of the event by the secant method on single-pose solves, started from
+the event angles of the cutoffs already solved, so a few solves replace a
+partial sweep. Only the first cutoff needs a coarse sweep of the cycle.
+
+Works with any measure(cutoff, crank_angles) -> (piston, valve) function:
+analytic_measure() for the closed-form model, or ControlPanel.measure() in
+FreeCAD (the panel's Find button).
+
+    python3 InverseCutoff.py 30 30
+"""
+import argparse
+import numpy as np
+from scipy.optimize import brentq, minimize_scalar
+import FirthKinematics
+from ValveEvents import HEAD_PORT, crossings, displacement
+
+# Sense of each end's cutoff crossing, running forwards - head end falling
+# through +lap, crank end rising through -lap, in the valve's displacement
+# towards opening the head port (see ValveEvents.HEAD_PORT)
+SENSE = {'head': -1, 'crank': 1}
+
+
+def analytic_measure(dims=FirthKinematics.DEFAULT_DIMENSIONS):
+    def measure(cutoff, crank_angles):
+        result = FirthKinematics.sweep(crank_angles, [cutoff], dims)
+        return result.piston, result.valve[0]
+    return measure
+
+
+class CutoffSearch(object):
+    """
+    :param measure: callable(cutoff, crank_angles) -> piston, valve arrays
+    :param end: 'head' or 'crank' - which end's cutoff to match
+    :param reverse: True to time events with the engine running backwards,
+    for reverse gear
+    :param window: crank angles the secant method may move from the
+    expected event
+    :param scan: crank angle step of the sweep for the first event
+    :param tolerance: crank angle tolerance of the event, degrees
+    :param head_port: see ValveEvents.HEAD_PORT
+    """
+
+    def __init__(self, measure, end='head', reverse=False, lap=2.0,
+                 centre=150.0, window=30.0, scan=10.0, tolerance=0.01,
+                 head_port=HEAD_PORT):
+        self.measure = measure
+        self.end = end
+        self.reverse = reverse
+        self.lap = lap
+        self.centre = centre
+        self.head_port = head_port
+        self.window = window
+        self.scan = scan
+        self.tolerance = tolerance
+        # radius link angle -> crank angle of its cutoff event
+        self.seen = {}
+        # radius link angle -> (crank angle, % of stroke)
+        self.events = {}
+        self.solves = 0
+        self.dead_centres = None
+
+    def sample(self, cutoff, angles):
+        """
+        :return: crank angles, piston positions and the valve's distance
+        past the lap, signed so the event is an upward crossing of zero
+        with increasing crank angle
+        """
+        angles = np.asarray(angles, dtype=float)
+        self.solves += len(angles)
+        piston, valve = self.measure(cutoff, angles)
+        sense = SENSE[self.end] * (-1 if self.reverse else 1)
+        level = self.lap if self.end == 'head' else -self.lap
+        return angles, np.asarray(piston, dtype=float), \
+            sense * (displacement(valve, self.centre, self.head_port) - level)
+
+    def event(self, cutoff, angles):
+        """
+        First event in the running direction, within sampled angles
+        :return: crank angle of the cutoff event, or NaN
+        """
+        angles, piston, past = self.sample(cutoff, angles)
+        if self.reverse:
+            return float(360 - crossings(360 - angles[::-1], past[::-1], 0,
+                                         rising=False))
+        return float(crossings(angles, past, 0, rising=True))
+
+    def refine(self, cutoff, guess):
+        """
+        Secant method on the crank angle, from the expected event
+        :return: crank angle and piston position at the event, NaN if it
+        doesn't converge on an upward crossing near guess
+        """
+        a0, a1 = guess, guess + 1
+        _, (p0,), (g0,) = self.sample(cutoff, [a0])
+        _, (p1,), (g1,) = self.sample(cutoff, [a1])
+        for _ in range(8):
+            if not np.isfinite(g1 - g0) or g1 == g0:
+                break
+            a2 = a1 - g1 * (a1 - a0) / (g1 - g0)
+            if abs(a2 - guess) > self.window:
+                break
+            a0, p0, g0 = a1, p1, g1
+            a1 = a2
+            _, (p1,), (g1,) = self.sample(cutoff, [a1])
+            if abs(a1 - a0) < self.tolerance:
+                if (g1 - g0) / (a1 - a0) > 0:
+                    return a1, p1
+                break
+        return np.nan, np.nan
+
+    def rescue(self, cutoff, guess):
+        """
+        Where refining misses, e.g. close to mid gear, the event is looked
+        for on the rising side of the valve's nearest peak. If that peak
+        doesn't reach the lap there is no event.
+        :return: crank angle and piston position at the event, or NaN
+        """
+        def past(angle):
+            return self.sample(cutoff, [angle])[2][0]
+        peak = minimize_scalar(lambda a: -past(a), method='bounded',
+                               bounds=(guess - self.window,
+                                       guess + self.window),
+                               options={'xatol': 0.5})
+        if not -peak.fun > 0:
+            return np.nan, np.nan
+        low = peak.x
+        for _ in range(3):
+            low -= self.window / 3
+            if past(low) < 0:
+                angle = brentq(past, low, peak.x, xtol=self.tolerance)
+                return angle, self.sample(cutoff, [angle])[1][0]
+        return np.nan, np.nan
+
+    def cutoff_event(self, cutoff):
+        """
+        The event, refined from where it's expected. The cycle is only swept
+        coarsely to find it for the first cutoff.
+        :return: crank angle of the event, % of stroke
+        """
+        if cutoff in self.events:
+            return self.events[cutoff]
+        guess = self.expected(cutoff)
+        if guess is None:
+            guess = self.event(cutoff, np.arange(0, 360 + self.scan,
+                                                 self.scan))
+        else:
+            angle, piston = self.refine(cutoff, guess)
+            if np.isnan(angle):
+                angle, piston = self.rescue(cutoff, guess)
+            return self.found(cutoff, angle, piston)
+        angle = piston = np.nan
+        if not np.isnan(guess):
+            angle, piston = self.refine(cutoff, guess)
+        return self.found(cutoff, angle, piston)
+
+    def found(self, cutoff, angle, piston):
+        if np.isnan(angle):
+            self.events[cutoff] = np.nan, np.nan
+        else:
+            self.seen[cutoff] = angle
+            self.events[cutoff] = angle, self.percent(cutoff, piston)
+        return self.events[cutoff]
+
+    def expected(self, cutoff):
+        """
+        Crank angle the event is expected at, interpolated from the
+        cutoffs already solved
+        """
+        if not self.seen:
+            return None
+        cutoffs = np.array(sorted(self.seen))
+        events = np.array([self.seen[c] for c in cutoffs])
+        if len(cutoffs) == 1:
+            return events[0]
+        i = np.clip(np.searchsorted(cutoffs, cutoff), 1, len(cutoffs) - 1)
+        slope = (events[i] - events[i - 1]) / (cutoffs[i] - cutoffs[i - 1])
+        return events[i - 1] + slope * (cutoff - cutoffs[i - 1])
+
+    def percent(self, cutoff, position):
+        if self.dead_centres is None:
+            # Piston position doesn't depend on cutoff
+            _, self.dead_centres, _ = self.sample(cutoff, [0, 180])
+        head, crank = self.dead_centres
+        origin = head if self.end == 'head' else crank
+        return 100 * abs(position - origin) / abs(crank - head)
+
+    def reachable(self, bracket, target=None, points=6, edge=3):
+        """
+        Samples the cutoff from full gear towards mid gear, stopping once
+        target is passed or where the valve no longer reaches the lap - then
+        bisecting that edge a few times
+        :param bracket: (mid gear angle, full gear angle)
+        :param target: cutoff, % of stroke, if only a bracket is wanted
+        :return: [(radius link angle, %)] of the angles that have a cutoff,
+        from full gear
+        """
+        mid, full = bracket
+        samples = []
+        stop = None
+        for angle in np.linspace(full, mid, points):
+            percent = self.cutoff_event(angle)[1]
+            if np.isnan(percent):
+                stop = angle
+                break
+            samples.append((angle, percent))
+            if target is not None and len(samples) > 1 and \
+                    (samples[-2][1] - target) * (percent - target) <= 0:
+                return samples
+        if samples and stop is not None:
+            for _ in range(edge):
+                angle = (samples[-1][0] + stop) / 2
+                percent = self.cutoff_event(angle)[1]
+                if np.isnan(percent):
+                    stop = angle
+                else:
+                    samples.append((angle, percent))
+        return samples
+
+    def find(self, target, bracket, tolerance=0.05):
+        """
+        :param target: cutoff, % of stroke
+        :param bracket: (mid gear angle, full gear angle) to search between
+        :return: dict - radius link angle, crank angle and % of stroke of the
+        cutoff event, and the number of solves used
+        :raises ValueError: if the target isn't reachable, giving the range
+        that is
+        """
+        def error(cutoff):
+            return self.cutoff_event(cutoff)[1] - target
+        samples = self.reachable(bracket, target)
+        for (a0, p0), (a1, p1) in zip(samples, samples[1:]):
+            if (p0 - target) * (p1 - target) <= 0:
+                break
+        else:
+            low, high = bracket
+            if not samples:
+                raise ValueError('no cutoff between {} and {} degrees'
+                                 .format(low, high))
+            percents = [p for _, p in samples]
+            raise ValueError(
+                'cutoff of {}% is not reachable between {} and {} degrees, '
+                'only {:.1f} - {:.1f}%'.format(target, low, high,
+                                               min(percents), max(percents)))
+        angle = brentq(error, a0, a1, xtol=tolerance)
+        event, percent = self.cutoff_event(angle)
+        return {'angle': angle, 'event': event, 'percent': percent,
+                'solves': self.solves}
+
+
+def find_cutoffs(measure, fwd_target, rev_target, mid=90, full_fwd=50,
+                 full_rev=130, **kwargs):
+    """
+    Radius link angles for the requested forward and reverse cutoffs
+    :return: forward result, reverse result - see CutoffSearch.find(), or
+    the ValueError for a target that isn't reachable
+    """
+    results = []
+    for target, full, reverse in ((fwd_target, full_fwd, False),
+                                  (rev_target, full_rev, True)):
+        search = CutoffSearch(measure, reverse=reverse, **kwargs)
+        try:
+            results.append(search.find(target, (mid, full)))
+        except ValueError as e:
+            results.append(e)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Radius link angle for a target cutoff (closed-form '
+                    'model)')
+    parser.add_argument('fwd', type=float, help='forward cutoff, %% stroke')
+    parser.add_argument('rev', type=float, help='reverse cutoff, %% stroke')
+    parser.add_argument('--end', default='head', choices=['head', 'crank'])
+    args = parser.parse_args()
+    for name, result in zip(('FWD', 'REV'), find_cutoffs(
+            analytic_measure(), args.fwd, args.rev, end=args.end)):
+        if isinstance(result, ValueError):
+            print(name, 'NOT FOUND -', result)
+            continue
+        print(name, 'ANGLE {angle:.3f} CUTOFF AT {event:.2f} DEG, '
+                    '{percent:.2f}% ({solves} SOLVES)'.format(**result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#! python
+# -*- coding: utf-8 -*-
+"""
+Typed measurements from the assembly.
+
+The measure constraints' Label2 strings are only their Distance property
+formatted to 2 decimal places with a unit suffix. This reads Distance
+itself, as a float at full precision, and packs the poses of a sweep
+straight into preallocated arrays.
+
+    Constraint019   piston
+    Constraint020   valve
+    Constraint022   eccentric rod end z
+    Constraint021   eccentric rod end x
+"""
+import numpy as np
+import ResultsFile
+
+CONSTRAINTS = ('Constraint019', 'Constraint020', 'Constraint022',
+               'Constraint021')
+CHANNELS = ('piston', 'valve', 'ecc_z', 'ecc_x')
+
+
+def measure(doc):
+    """
+    :param doc: FreeCAD document, solved
+    :return: piston, valve, eccentric z, eccentric x as floats, mm
+    """
+    return tuple(getattr(doc, name).Distance.Value for name in CONSTRAINTS)
+
+
+def as_floats(pose):
+    """Pose as floats, also for Label2 strings cached by older runs"""
+    return tuple(ResultsFile.value(v) for v in pose)
+
+
+class SweepBuffer(object):
+    """
+    Preallocated arrays for every pose of a sweep
+    :param cutoffs: radius link angles, one valve row each
+    :param crank_angles: crank angles, one column each
+    """
+
+    def __init__(self, cutoffs, crank_angles):
+        self.cutoffs = list(cutoffs)
+        self.crank = np.asarray(crank_angles, dtype=float)
+        k, n = len(self.cutoffs), len(self.crank)
+        self.piston = np.full(n, np.nan)
+        self.valve = np.full((k, n), np.nan)
+        self.ecc_z = np.full((k, n), np.nan)
+        self.ecc_x = np.full((k, n), np.nan)
+
+    def put(self, row, poses):
+        """
+        :param row: index of the cutoff
+        :param poses: (n, 4) piston, valve, eccentric z, eccentric x for
+        every crank angle
+        """
+        self.piston = np.where(np.isnan(self.piston), poses[:, 0],
+                               self.piston)
+        self.valve[row] = poses[:, 1]
+        self.ecc_z[row] = poses[:, 2]
+        self.ecc_x[row] = poses[:, 3]
+
+    def is_complete(self):
+        return not any(np.isnan(getattr(self, c)).any() for c in CHANNELS)
+
+    def results(self, header):
+        """
+        :return: ResultsFile.Results
+        """
+        return ResultsFile.Results(self.crank, self.piston, self.valve,
+                                   self.ecc_z, self.ecc_x, header)
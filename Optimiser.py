@@ -0,0 +1,244 @@
+#!/usr/bin/python3.6
+"""
+Geometry optimiser for the valve gear.
+
+Treats linkage dimensions and the forward and reverse radius link angles as
+parameters and scores each design on three objectives built from its valve
+events (see ValveEvents), all to be minimised:
+    lead        difference between head and crank end lead
+    cutoff      distance of both ends' cutoff from the target % of stroke
+    opening     difference between head and crank end maximum port opening
+each averaged over forward and reverse gear. A design whose events can't
+all be found scores PENALTY on every objective, plus how far it is from
+working - the valve travel short of the lap, or the share of poses the
+linkage can't reach - so the search is led towards designs that work.
+
+Candidates are evaluated in batches across a process pool with the
+closed-form model (FirthKinematics). The 'freecad' backend solves the real
+assembly headless instead (SweepRunner); the model's dimensions can't be
+changed that way, so only the radius link angles are searched. Its
+candidates are evaluated one at a time, each sweep spread over SweepRunner's
+own worker processes. The search samples the parameter box, then repeatedly
+perturbs the current Pareto front, which is reported at the end.
+
+    python3 Optimiser.py --target 50 --generations 20 --out front.csv
+"""
+import argparse
+import csv
+import multiprocessing
+import os
+import tempfile
+import numpy as np
+import FirthKinematics
+import ResultsFile
+from ValveEvents import displacement, valve_events, results_events
+
+OBJECTIVES = ('lead', 'cutoff', 'opening')
+# Score of every objective of a design whose events can't all be found
+PENALTY = 1000.0
+
+# Searched parameters and their (low, high) bounds
+BOUNDS = {
+    'eccentric_radius': (2.5, 4.5),
+    'eccentric_angle': (260.0, 280.0),
+    'radius_link': (35.0, 55.0),
+    'die_pin': (48.0, 60.0),
+    'rocker_angle': (90.0, 110.0),
+    'fwd_cutoff': (60.0, 88.0),
+    'rev_cutoff': (92.0, 120.0),
+}
+CUTOFFS = ('fwd_cutoff', 'rev_cutoff')
+
+
+def shortfall(valve, lap):
+    """
+    :param valve: (k, n) valve displacement from mid travel
+    :return: how far the valve travel falls short of the lap, summed over
+    both ends and all cutoffs
+    """
+    return (np.maximum(lap - np.nanmax(valve, axis=-1), 0) +
+            np.maximum(lap + np.nanmin(valve, axis=-1), 0)).sum()
+
+
+def objectives(events, target, miss=0.0):
+    """
+    :param events: valve events of the forward and reverse cutoffs
+    :param target: cutoff as % of stroke
+    :param miss: how far the design is from working, added to PENALTY if
+    any of its events are missing
+    :return: lead, cutoff and opening objectives
+    """
+    lead = np.abs(events['head_lead'] - events['crank_lead'])
+    cutoff = (np.abs(events['head_cutoff_pct'] - target) +
+              np.abs(events['crank_cutoff_pct'] - target))
+    opening = np.abs(events['head_max_opening'] -
+                     events['crank_max_opening'])
+    scores = np.array([lead.mean(), cutoff.mean(), opening.mean()])
+    if not np.isfinite(scores).all():
+        return np.full(len(OBJECTIVES), PENALTY + miss)
+    return scores
+
+
+def evaluate_analytic(params, target, lap=2.0, centre=150.0):
+    """
+    :param params: dict of parameter values, see BOUNDS
+    :return: objectives
+    """
+    dims = FirthKinematics.DEFAULT_DIMENSIONS._replace(
+        **{k: v for k, v in params.items() if k not in CUTOFFS})
+    crank = np.arange(0, 360.5, 0.5)
+    result = FirthKinematics.sweep(crank, [params[c] for c in CUTOFFS],
+                                   dims)
+    unreachable = np.isnan(result.valve).mean()
+    if unreachable:
+        # Worse than any design that assembles
+        return np.full(len(OBJECTIVES), PENALTY * (2 + unreachable))
+    valve = displacement(result.valve, centre)
+    events = valve_events(crank, result.piston, valve, lap,
+                          reverse=np.array([False, True]))
+    return objectives(events, target, shortfall(valve, lap))
+
+
+def evaluate_freecad(params, target, lap=2.0, centre=150.0, workers=None):
+    import SweepRunner
+    cutoffs = [str(params[c]) for c in CUTOFFS]
+    with tempfile.TemporaryDirectory() as workdir:
+        output = os.path.join(workdir, 'candidate.npz')
+        SweepRunner.sweep(output, cutoffs, list(range(0, 370, 10)),
+                          workers or os.cpu_count())
+        results = ResultsFile.load(output)
+        events = results_events(results, lap, centre=centre)
+    return objectives(events, target,
+                      shortfall(displacement(results.valve, centre), lap))
+
+
+def _evaluate(job):
+    params, target, lap, centre = job
+    return evaluate_analytic(params, target, lap, centre)
+
+
+def pareto_front(scores):
+    """
+    :param scores: (candidates, objectives), lower is better
+    :return: boolean mask of the non-dominated candidates
+    """
+    no_worse = np.all(scores[:, np.newaxis] <= scores[np.newaxis], axis=-1)
+    better = np.any(scores[:, np.newaxis] < scores[np.newaxis], axis=-1)
+    dominated = np.any(no_worse & better, axis=0)
+    return ~dominated & np.all(np.isfinite(scores), axis=1)
+
+
+class Optimiser(object):
+    """
+    Pareto search over BOUNDS
+    :param names: parameters to search, default all of BOUNDS
+    """
+
+    def __init__(self, target=50.0, backend='analytic', names=None,
+                 workers=None, seed=None, lap=2.0, centre=150.0):
+        if backend == 'freecad':
+            names = list(CUTOFFS)
+        self.names = list(names or BOUNDS)
+        self.low = np.array([BOUNDS[n][0] for n in self.names])
+        self.high = np.array([BOUNDS[n][1] for n in self.names])
+        self.target = target
+        self.lap = lap
+        self.centre = centre
+        self.backend = backend
+        self.workers = workers or os.cpu_count()
+        self.rng = np.random.RandomState(seed)
+        self.params = np.empty((0, len(self.names)))
+        self.scores = np.empty((0, len(OBJECTIVES)))
+
+    def sample(self, n):
+        """Latin hypercube sample of the parameter box"""
+        strata = np.array([self.rng.permutation(n) for _ in self.names]).T
+        u = (strata + self.rng.uniform(size=strata.shape)) / n
+        return self.low + u * (self.high - self.low)
+
+    def perturb(self, n, scale):
+        """New candidates scattered around the current Pareto front"""
+        front = self.params[pareto_front(self.scores)]
+        if len(front) == 0:
+            return self.sample(n)
+        parents = front[self.rng.randint(len(front), size=n)]
+        step = self.rng.normal(scale=scale, size=parents.shape)
+        return np.clip(parents + step * (self.high - self.low), self.low,
+                       self.high)
+
+    def evaluate(self, candidates, pool=None):
+        """
+        :param pool: process pool for the analytic backend, not used by the
+        freecad backend, which evaluates one candidate at a time
+        """
+        jobs = [(dict(zip(self.names, c)), self.target, self.lap,
+                 self.centre) for c in candidates]
+        if self.backend == 'freecad':
+            scores = [evaluate_freecad(*job, workers=self.workers)
+                      for job in jobs]
+        else:
+            chunk = max(1, len(jobs) // (4 * self.workers))
+            scores = pool.map(_evaluate, jobs, chunksize=chunk)
+        self.params = np.vstack([self.params, candidates])
+        self.scores = np.vstack([self.scores, scores])
+
+    def run(self, population=200, generations=10, scale=0.1):
+        if self.backend == 'freecad':
+            # SweepRunner already runs each sweep across the workers
+            return self.search(None, population, generations, scale)
+        with multiprocessing.Pool(self.workers) as pool:
+            return self.search(pool, population, generations, scale)
+
+    def search(self, pool, population, generations, scale):
+        self.evaluate(self.sample(population), pool)
+        for generation in range(generations):
+            # Narrow the search as the front settles
+            sigma = scale * (1 - generation / generations)
+            self.evaluate(self.perturb(population, sigma), pool)
+            print('GENERATION', generation + 1, 'FRONT',
+                  pareto_front(self.scores).sum())
+        return self.front()
+
+    def front(self):
+        """
+        :return: parameter names + objectives, and one row per Pareto
+        optimal design, sorted by cutoff error
+        """
+        mask = pareto_front(self.scores)
+        rows = np.hstack([self.params[mask], self.scores[mask]])
+        rows = rows[np.argsort(rows[:, len(self.names) + 1])]
+        return self.names + list(OBJECTIVES), rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Pareto search over valve gear geometry')
+    parser.add_argument('--target', type=float, default=50.0,
+                        help='cutoff, %% of stroke')
+    parser.add_argument('--backend', default='analytic',
+                        choices=['analytic', 'freecad'])
+    parser.add_argument('--population', type=int, default=200)
+    parser.add_argument('--generations', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--lap', type=float, default=2.0,
+                        help='steam lap, mm')
+    parser.add_argument('--centre', type=float, default=150.0,
+                        help='valve position at mid travel')
+    parser.add_argument('--out', default='front.csv')
+    args = parser.parse_args()
+    optimiser = Optimiser(args.target, args.backend, workers=args.workers,
+                          seed=args.seed, lap=args.lap, centre=args.centre)
+    names, rows = optimiser.run(args.population, args.generations)
+    with open(args.out, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(names)
+        writer.writerows(np.round(rows, 4).tolist())
+    print(' '.join('{:>18}'.format(n) for n in names))
+    for row in rows:
+        print(' '.join('{:18.4f}'.format(v) for v in row))
+    print("FILE WRITTEN", args.out)
+
+
+if __name__ == "__main__":
+    main()
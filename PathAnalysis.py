@@ -0,0 +1,194 @@
+#!/usr/bin/python3.6
+"""
+Eccentric rod end path comparison.
+
+Each cutoff's rocking lever end path (x, z, as Analyser.get_path plots it) is
+resampled densely from a spline of the run, and a cKDTree built over its
+points the first time it is compared. Between two paths A and B, with d(a, B)
+the distance from a point of A to the nearest point of B,
+    hausdorff   max(max d(a, B), max d(b, A))
+    mean        (mean d(a, B) + mean d(b, A)) / 2
+Distances are to sampled points, so their error is at most half the sample
+spacing along the path.
+
+Each path also has its swept area (shoelace formula, closing the path if the
+run isn't a full cycle) and peak curvature
+    k = |x'z'' - z'x''| / (x'^2 + z'^2)^1.5
+leaving out samples where the end moves slower than a fraction of its top
+speed - the lever end reverses along its arc, and curvature is undefined
+where it stops.
+
+Paths, with their trees, are cached per file while the file is unchanged, so
+every pair of a Results/ directory can be compared without rebuilding them.
+
+    python3 PathAnalysis.py Results/ --step 0.1
+"""
+import argparse
+from collections import namedtuple
+import itertools
+import os
+import numpy as np
+from scipy.spatial import cKDTree
+import ResultsFile
+from Smoothing import fit, PERIOD
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+PathMetrics = namedtuple('PathMetrics', ['name', 'area', 'curvature',
+                                         'curvature_angle'])
+Deviation = namedtuple('Deviation', ['hausdorff', 'mean'])
+
+# Path of file: (mtime, step, Paths)
+_cache = {}
+
+
+class Paths(object):
+    """Densely sampled eccentric rod end paths of one run, one per cutoff"""
+
+    def __init__(self, results, step=0.1, min_speed=0.1):
+        """
+        :param results: ResultsFile.Results
+        :param step: crank angle between samples, degrees
+        :param min_speed: fraction of a path's top speed below which its
+        curvature isn't measured
+        """
+        start, stop = results.crank[0], results.crank[-1]
+        self.closed = stop - start == PERIOD
+        self.crank = np.arange(start, stop + step / 2, step)
+        if self.closed:
+            # Last sample repeats the first
+            self.crank = self.crank[self.crank < stop]
+        self.names = list(results.header['names'])
+        k = len(self.names)
+        spline = fit(results.crank, np.vstack([results.ecc_x, results.ecc_z]))
+        value, first, second = (spline.derivative(d)(self.crank)
+                                for d in (0, 1, 2))
+        # (cutoff, sample, x z)
+        self.points = np.stack([value[:k], value[k:]], -1)
+        speed = np.hypot(first[:k], first[k:])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            curvature = np.abs(
+                first[:k] * second[k:] - first[k:] * second[:k]) / speed ** 3
+        moving = speed > min_speed * speed.max(-1, keepdims=True)
+        self.curvature = np.where(moving, curvature, np.nan)
+        self._trees = {}
+
+    def tree(self, i):
+        """cKDTree of path i, built on first use"""
+        if i not in self._trees:
+            self._trees[i] = cKDTree(self.points[i])
+        return self._trees[i]
+
+    def area(self):
+        """:return: (cutoff,) area enclosed by each path"""
+        x, z = self.points[..., 0], self.points[..., 1]
+        return 0.5 * np.abs((x * np.roll(z, -1, -1) -
+                             np.roll(x, -1, -1) * z).sum(-1))
+
+    def metrics(self):
+        """:return: PathMetrics for each cutoff"""
+        curvature = np.nan_to_num(self.curvature)
+        peak = curvature.argmax(-1)
+        return [PathMetrics(name, area, curvature[i, peak[i]],
+                            self.crank[peak[i]])
+                for i, (name, area) in enumerate(zip(self.names,
+                                                     self.area()))]
+
+
+def deviation(paths_a, i, paths_b, j):
+    """
+    :return: Deviation between path i of paths_a and path j of paths_b
+    """
+    a_to_b = paths_b.tree(j).query(paths_a.points[i])[0]
+    b_to_a = paths_a.tree(i).query(paths_b.points[j])[0]
+    return Deviation(max(a_to_b.max(), b_to_a.max()),
+                     (a_to_b.mean() + b_to_a.mean()) / 2)
+
+
+def compare_cutoffs(paths):
+    """
+    :return: rows of name, name, Deviation for each pair of cutoffs in a run
+    """
+    return [(paths.names[i], paths.names[j], deviation(paths, i, paths, j))
+            for i, j in itertools.combinations(range(len(paths.names)), 2)]
+
+
+def load(fname, step=0.1):
+    """
+    :return: Paths of a results file, cached until the file changes
+    """
+    key = os.path.abspath(fname)
+    mtime = os.path.getmtime(fname)
+    cached = _cache.get(key)
+    if cached is None or cached[:2] != (mtime, step):
+        cached = (mtime, step, Paths(ResultsFile.load(fname), step))
+        _cache[key] = cached
+    return cached[2]
+
+
+def load_files(files, step=0.1):
+    """
+    Loads every file, reporting and leaving out those that can't be read as
+    results, e.g. the events.csv ValveEvents writes
+    :return: [(fname, Paths)] of the files that loaded
+    """
+    loaded = []
+    for fname in files:
+        try:
+            loaded.append((fname, load(fname, step)))
+        except Exception as e:
+            print('SKIPPED', fname, '{}: {}'.format(type(e).__name__, e))
+    return loaded
+
+
+def compare_files(files, step=0.1):
+    """
+    Compares every pair of files, cutoff by cutoff where their names match
+    :return: rows of file, file, cutoff name, Deviation
+    """
+    rows = []
+    for file_a, file_b in itertools.combinations(files, 2):
+        paths_a, paths_b = load(file_a, step), load(file_b, step)
+        for i, name in enumerate(paths_a.names):
+            if name in paths_b.names:
+                rows.append((file_a, file_b, name,
+                             deviation(paths_a, i, paths_b,
+                                       paths_b.names.index(name))))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare eccentric rod end paths across results files')
+    parser.add_argument('source', nargs='?',
+                        default=os.path.join(DIRECTORY, 'Results'),
+                        help='directory or glob of .npz/.csv results')
+    parser.add_argument('--step', type=float, default=0.1,
+                        help='crank angle between path samples, degrees')
+    args = parser.parse_args()
+    loaded = load_files(ResultsFile.find_files(args.source), args.step)
+    if not loaded:
+        print('NO RESULTS FILES IN', args.source)
+        return
+    files = [fname for fname, _ in loaded]
+    print('{:<30}{:>8}{:>12}{:>12}{:>8}'.format(
+        'FILE', 'GEAR', 'AREA', 'CURVATURE', 'DEG'))
+    for fname, paths in loaded:
+        for m in paths.metrics():
+            print('{:<30}{:>8}{:>12.3f}{:>12.4f}{:>8.1f}'.format(
+                os.path.basename(fname), m.name, m.area, m.curvature,
+                m.curvature_angle))
+        for name_a, name_b, d in compare_cutoffs(paths):
+            print('{:<30}{:>8}{:>12.4f}{:>12.4f}'.format(
+                '', name_a + '/' + name_b, d.hausdorff, d.mean))
+    if len(files) > 1:
+        print('{:<30}{:<30}{:>6}{:>12}{:>12}'.format(
+            'FILE', 'FILE', 'GEAR', 'HAUSDORFF', 'MEAN'))
+        for file_a, file_b, name, d in compare_files(files, args.step):
+            print('{:<30}{:<30}{:>6}{:>12.4f}{:>12.4f}'.format(
+                os.path.basename(file_a), os.path.basename(file_b), name,
+                d.hausdorff, d.mean))
+
+
+if __name__ == "__main__":
+    main()
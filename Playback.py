@@ -0,0 +1,119 @@
+#! python
+# -*- coding: utf-8 -*-
+"""
+Timer driven motion playback for the assembly.
+
+The mechanism is solved once per crank angle and the placement of every
+object captured. Playback then only assigns the cached placements from a
+QTimer, interpolating between the solved frames, so nothing is re-solved
+and the GUI stays responsive while it runs.
+"""
+from bisect import bisect_right
+from PyQt5 import QtCore
+import FreeCAD as App
+import FreeCADGui as Gui
+
+
+def capture(document):
+    """
+    :return: dict of object name: copy of its placement
+    """
+    return {obj.Name: App.Placement(obj.Placement) for obj in
+            document.Objects if hasattr(obj, 'Placement')}
+
+
+def blend(start, end, fraction):
+    """Placement part way between two, straight to end if it can't"""
+    if hasattr(start, 'sclerp'):
+        return start.sclerp(end, fraction)
+    return end if fraction >= 0.5 else start
+
+
+class MotionPlayer(QtCore.QObject):
+    """
+    :param document: FreeCAD document
+    :param actuator: crank driving constraint object
+    :param fps: frames shown per second
+    """
+    frame_shown = QtCore.pyqtSignal(float)
+
+    def __init__(self, document, actuator, fps=30):
+        super(MotionPlayer, self).__init__()
+        self.doc = document
+        self.actuator = actuator
+        self.angles = []
+        self.frames = []
+        self.cutoff = None
+        self.angle = 0.0
+        # Crank degrees per second
+        self.speed = 90.0
+        self.loop = True
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(int(1000 / fps))
+        self.timer.timeout.connect(self.tick)
+
+    def precompute(self, crank_angles, cutoff=None):
+        """
+        Solves each crank angle once and keeps every object's placement
+        :param cutoff: radius link angle the frames are for
+        """
+        print('PRECOMPUTING', len(crank_angles), 'FRAMES')
+        start = self.actuator.Angle
+        self.angles = list(crank_angles)
+        self.frames = []
+        for angle in self.angles:
+            self.actuator.Angle = angle
+            Gui.runCommand("asm3CmdQuickSolve", 0)
+            self.frames.append(capture(self.doc))
+        self.actuator.Angle = start
+        self.cutoff = cutoff
+        self.angle = self.angles[0]
+
+    def is_stale(self, cutoff):
+        return not self.frames or cutoff != self.cutoff
+
+    def is_playing(self):
+        return self.timer.isActive()
+
+    def play(self):
+        if not self.frames:
+            return
+        if self.angle >= self.angles[-1]:
+            self.angle = self.angles[0]
+        self.timer.start()
+
+    def pause(self):
+        self.timer.stop()
+
+    def set_speed(self, speed):
+        self.speed = speed
+
+    def set_loop(self, loop):
+        self.loop = loop
+
+    def tick(self):
+        first, last = self.angles[0], self.angles[-1]
+        self.angle += self.speed * self.timer.interval() / 1000
+        if self.angle >= last:
+            if self.loop:
+                self.angle = first + (self.angle - first) % (last - first)
+            else:
+                self.angle = last
+                self.pause()
+        self.show_frame(self.angle)
+
+    def show_frame(self, angle):
+        """
+        Assigns the cached placements, interpolated between the solved
+        frames either side of the crank angle
+        """
+        i = min(max(bisect_right(self.angles, angle) - 1, 0),
+                len(self.angles) - 2)
+        fraction = (angle - self.angles[i]) / (self.angles[i + 1] -
+                                               self.angles[i])
+        start, end = self.frames[i], self.frames[i + 1]
+        for name, placement in start.items():
+            obj = self.doc.getObject(name)
+            if obj is not None:
+                obj.Placement = blend(placement, end[name], fraction)
+        self.frame_shown.emit(angle)
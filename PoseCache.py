@@ -0,0 +1,101 @@
+#! python
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of solved poses, so repeated and overlapping sweeps don't
+re-solve poses that have already been measured.
+
+Poses are keyed on (model hash, cutoff angle, crank angle). The model hash is
+the design hash of the document (see FCStdReader.design_hash), which leaves
+out the driver angle and cutoff datum, so changing a dimension evicts
+everything solved from the old design but saving mid-sweep doesn't.
+"""
+import os
+import sqlite3
+import FCStdReader
+
+
+def model_hash(source):
+    """
+    :param source: path to the .FCStd file, or an open FreeCAD document -
+    its current state, including edits that haven't been saved
+    :return: design hash, see FCStdReader.design_hash
+    """
+    if hasattr(source, 'Content'):
+        return FCStdReader.read_document(source)['model']
+    return FCStdReader.read_model(source)['model']
+
+
+class PoseCache(object):
+    """
+    SQLite table of measured poses for one model. Values are stored as they
+    were measured - piston, valve, eccentric z, eccentric x.
+    """
+
+    def __init__(self, model, path):
+        self.model = None
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS poses ('
+                        'model TEXT, cutoff REAL, angle REAL, piston, '
+                        'valve, ecc_z, ecc_x, '
+                        'PRIMARY KEY (model, cutoff, angle))')
+        self.use_model(model)
+
+    @classmethod
+    def for_model(cls, document):
+        """
+        Cache file alongside the model, keyed on its current design
+        :param document: open FreeCAD document
+        """
+        path = os.path.join(os.path.dirname(os.path.abspath(
+            document.FileName)), 'pose_cache.sqlite')
+        return cls(model_hash(document), path)
+
+    def use_model(self, model):
+        """
+        Keys the cache on model, evicting poses from any other design
+        :param model: model hash
+        """
+        if model == self.model:
+            return
+        self.model = model
+        self.db.execute('DELETE FROM poses WHERE model != ?', (model,))
+        self.db.commit()
+
+    def get(self, cutoff, angle):
+        """
+        :return: (piston, valve, ecc_z, ecc_x) or None if not cached
+        """
+        return self.db.execute(
+            'SELECT piston, valve, ecc_z, ecc_x FROM poses '
+            'WHERE model = ? AND cutoff = ? AND angle = ?',
+            (self.model, float(cutoff), float(angle))).fetchone()
+
+    def put(self, cutoff, angle, pose):
+        self.db.execute('INSERT OR REPLACE INTO poses VALUES '
+                        '(?, ?, ?, ?, ?, ?, ?)',
+                        (self.model, float(cutoff), float(angle)) +
+                        tuple(pose))
+
+    def nearest(self, cutoff, angle):
+        """
+        Closest cached crank angles either side of angle
+        :return: (angle, pose) below or at angle and above it, either None
+        if there isn't one
+        """
+        below = self.db.execute(
+            'SELECT angle, piston, valve, ecc_z, ecc_x FROM poses '
+            'WHERE model = ? AND cutoff = ? AND angle <= ? '
+            'ORDER BY angle DESC LIMIT 1',
+            (self.model, float(cutoff), float(angle))).fetchone()
+        above = self.db.execute(
+            'SELECT angle, piston, valve, ecc_z, ecc_x FROM poses '
+            'WHERE model = ? AND cutoff = ? AND angle > ? '
+            'ORDER BY angle LIMIT 1',
+            (self.model, float(cutoff), float(angle))).fetchone()
+        return [(row[0], row[1:]) if row else None for row in (below, above)]
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,119 @@
+#! python
+# -*- coding: utf-8 -*-
+"""
+Per-phase timing for sweeps - solve, recompute, measurement reads, file
+writes - with counts of failures and retries.
+
+    profiler = Profiler()
+    with profiler.phase('solve', cutoff=cutoff, angle=angle):
+        Gui.runCommand("asm3CmdQuickSolve", 0)
+    profiler.count('set_cutoff_retry')
+    profiler.print_summary()
+    profiler.chrome_trace('trace.json')
+
+The trace opens in chrome://tracing or https://ui.perfetto.dev
+"""
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class Profiler(object):
+    """
+    Records wall time of named phases, tagged with the cutoff and crank
+    angle they were for
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        # (name, start, duration, args, thread), times in seconds from
+        # origin
+        self.events = []
+        self.counts = defaultdict(int)
+
+    @contextmanager
+    def phase(self, name, **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.events.append((name, start - self.origin, end - start,
+                                args, threading.get_ident()))
+
+    def count(self, name, n=1):
+        """Counts an occurrence of something untimed, e.g. a retry"""
+        self.counts[name] += n
+
+    def reset(self):
+        self.__init__()
+
+    def totals(self, key=None):
+        """
+        :param key: event argument to break the phases down by, e.g.
+        'cutoff'
+        :return: {(phase, key value): [count, total, max]}
+        """
+        stats = {}
+        for name, _, duration, args, _ in self.events:
+            group = (name, args.get(key)) if key else (name, None)
+            stat = stats.setdefault(group, [0, 0.0, 0.0])
+            stat[0] += 1
+            stat[1] += duration
+            stat[2] = max(stat[2], duration)
+        return stats
+
+    def slowest(self, name, n=5):
+        """The n longest events of a phase"""
+        events = [e for e in self.events if e[0] == name]
+        return sorted(events, key=lambda e: e[2], reverse=True)[:n]
+
+    def summary(self, key=None):
+        """
+        :return: table rows of phase, [key value,] count, total s, mean ms,
+        max ms and % of the run, slowest phase first
+        """
+        elapsed = time.perf_counter() - self.origin
+        rows = []
+        for (name, value), (n, total, longest) in self.totals(key).items():
+            row = [name] + ([value] if key else [])
+            rows.append(row + [n, total, 1000 * total / n, 1000 * longest,
+                               100 * total / elapsed])
+        return sorted(rows, key=lambda r: r[-4], reverse=True)
+
+    def print_summary(self, key='cutoff'):
+        print('{:<16}{:>8}{:>10}{:>10}{:>10}{:>8}'.format(
+            'PHASE', 'COUNT', 'TOTAL S', 'MEAN MS', 'MAX MS', '%'))
+        for name, n, total, mean, longest, pct in self.summary():
+            print('{:<16}{:>8}{:>10.3f}{:>10.2f}{:>10.2f}{:>8.1f}'.format(
+                name, n, total, mean, longest, pct))
+        if key:
+            print('{:<16}{:>8}{:>8}{:>10}{:>10}{:>10}'.format(
+                'PHASE', key.upper(), 'COUNT', 'TOTAL S', 'MEAN MS',
+                'MAX MS'))
+            for name, value, n, total, mean, longest, _ in \
+                    self.summary(key):
+                if value is not None:
+                    print('{:<16}{:>8}{:>8}{:>10.3f}{:>10.2f}{:>10.2f}'
+                          .format(name, value, n, total, mean, longest))
+        for _, _, duration, args, _ in self.slowest('solve'):
+            print('SLOW SOLVE {:.1f} MS'.format(1000 * duration), args)
+        for name in sorted(self.counts):
+            print('{:<16}{:>8}'.format(name.upper(), self.counts[name]))
+
+    def chrome_trace(self, fname):
+        """Writes the events in Chrome's trace event format"""
+        pid = os.getpid()
+        end = 1e6 * (time.perf_counter() - self.origin)
+        trace = [{'name': name, 'ph': 'X', 'ts': 1e6 * start,
+                  'dur': 1e6 * duration, 'pid': pid, 'tid': tid,
+                  'args': args}
+                 for name, start, duration, args, tid in self.events]
+        trace += [{'name': name, 'ph': 'C', 'ts': end, 'pid': pid,
+                   'args': {name: n}} for name, n in self.counts.items()]
+        with open(fname, 'w') as f:
+            json.dump({'traceEvents': trace}, f)
+        print("FILE WRITTEN", fname)
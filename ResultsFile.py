@@ -0,0 +1,180 @@
+#! python
+# -*- coding: utf-8 -*-
+"""
+Typed results container.
+
+A run is stored as an uncompressed .npz of float arrays plus a small JSON
+header, so loading is an array view with no string parsing:
+    crank   (n,)    crank angles, degrees
+    piston  (n,)    piston position
+    valve   (k, n)  valve position, one row per cutoff
+    ecc_z   (k, n)  eccentric rod end z, one row per cutoff
+    ecc_x   (k, n)  eccentric rod end x, one row per cutoff
+    header          JSON - cutoffs, names, units, model hash
+and optionally the Fourier coefficients of the piston and valve rows (see
+Harmonics).
+The stringly-typed .csv written by ControlPanel.write_file can still be read,
+and written as an export.
+"""
+import ast
+import csv
+import glob
+import json
+import os
+from collections import namedtuple
+import numpy as np
+
+Results = namedtuple('Results', ['crank', 'piston', 'valve', 'ecc_z',
+                                 'ecc_x', 'header'])
+
+ARRAYS = ('crank', 'piston', 'valve', 'ecc_z', 'ecc_x')
+NAMES = ['Fwd', 'Mid', 'Rev']
+
+
+def make_header(cutoffs, names=None, units='mm', model=''):
+    """
+    :param cutoffs: radius link angle of each valve row, None if not known
+    :param names: name of each cutoff, defaults to Fwd, Mid, Rev
+    :param model: hash of the model the run was solved from (see
+    PoseCache.model_hash)
+    """
+    cutoffs = [None if c is None else float(c) for c in cutoffs]
+    if names is None:
+        names = NAMES if len(cutoffs) == len(NAMES) else \
+            ['Cutoff {}'.format(i + 1) for i in range(len(cutoffs))]
+    return {'cutoffs': cutoffs, 'names': list(names), 'units': units,
+            'model': model}
+
+
+def save(fname, results, harmonics=None):
+    """
+    :param harmonics: Harmonics.HarmonicFit of the piston and valve rows, to
+    store with the run
+    """
+    arrays = {name: np.asarray(getattr(results, name), dtype=float)
+              for name in ARRAYS}
+    if harmonics is not None:
+        arrays['harmonics'] = harmonics.coefficients
+        arrays['harmonics_residual'] = harmonics.residual
+    np.savez(fname, header=np.array(json.dumps(results.header)), **arrays)
+
+
+def load(fname):
+    """
+    Loads a .npz run, or a .csv in the ControlPanel.write_file layout
+    :return: Results
+    """
+    if str(fname).endswith('.csv'):
+        return read_csv(fname)
+    with np.load(fname) as data:
+        arrays = [data[name] for name in ARRAYS]
+        header = json.loads(str(data['header']))
+    return Results(*arrays, header=header)
+
+
+def value(label):
+    """Float from a Label2 string such as '152.34 mm'"""
+    if isinstance(label, str):
+        return float(label[:-3])
+    return float(label)
+
+
+def from_rows(rows, header=None):
+    """
+    Builds Results from rows in the ControlPanel.write_file layout: crank
+    angle, piston, one valve column per cutoff, then one [z, x] eccentric rod
+    end column per cutoff. Cells may be Label2 strings or numbers, and the
+    eccentric cells lists or their string form as read back from a .csv.
+    """
+    rows = list(rows)
+    cutoffs = len([c for c in rows[0][2:] if not is_pair(c)])
+    crank = np.array([float(row[0]) for row in rows])
+    piston = np.array([value(row[1]) for row in rows])
+    valve = np.array([[value(v) for v in row[2:2 + cutoffs]]
+                      for row in rows]).reshape(len(rows), cutoffs).T
+    eccs = []
+    for row in rows:
+        cells = row[2 + cutoffs:]
+        cells = [ast.literal_eval(c) if isinstance(c, str) else c
+                 for c in cells]
+        eccs.append([[value(z), value(x)] for z, x in cells])
+    eccs = np.array(eccs).reshape(len(rows), -1, 2)
+    if header is None:
+        header = make_header([None] * cutoffs)
+    return Results(crank, piston, valve, eccs[:, :, 0].T, eccs[:, :, 1].T,
+                   header)
+
+
+def is_pair(cell):
+    """True for an eccentric rod end [z, x] cell"""
+    return isinstance(cell, (list, tuple)) or \
+        (isinstance(cell, str) and cell.startswith('['))
+
+
+def read_csv(fname, header=None):
+    """
+    Reads a .csv in a single pass and repairs it in memory - the source file
+    is never modified
+    :return: Results
+    """
+    with open(fname, newline='') as csv_file:
+        rows = list(csv.reader(csv_file, quoting=csv.QUOTE_NONNUMERIC))
+    return from_rows(repair_rows(rows), header)
+
+
+def repair_rows(rows):
+    """
+    Older runs of FirthValveGearController.py left empty fields in the 0
+    degree row. The crank is in the same position at 360 degrees, so a
+    missing or incomplete 0 degree row is replaced by the 360 degree row.
+    :param rows: rows as read from the .csv
+    :return: rows, starting at 0 degrees
+    """
+    rows = [row for row in rows if row]
+    last = [row for row in rows if float(row[0]) == 360]
+    first = [row for row in rows if float(row[0]) == 0]
+    if last and (not first or '' in first[0] or
+                 len(first[0]) < len(last[0])):
+        rows = [[0] + last[0][1:]] + [row for row in rows
+                                      if float(row[0]) != 0]
+    return rows
+
+
+def label(val):
+    """Formats a value the way FreeCAD's Label2 shows it, e.g. '152.34 mm'"""
+    return '{:.2f} mm'.format(val)
+
+
+def rows(results):
+    """
+    Rows in the layout written by ControlPanel.write_file
+    :param results: Results, or anything with the same array fields
+    :return: list of rows
+    """
+    table = []
+    for i, angle in enumerate(results.crank):
+        row = [int(angle) if float(angle).is_integer() else float(angle),
+               label(results.piston[i])]
+        row.extend(label(v) for v in results.valve[:, i])
+        row.extend([label(z), label(x)] for z, x in
+                   zip(results.ecc_z[:, i], results.ecc_x[:, i]))
+        table.append(row)
+    return table
+
+
+def export_csv(fname, results):
+    with open(fname, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file, quoting=csv.QUOTE_NONNUMERIC)
+        for row in rows(results):
+            writer.writerow(row)
+
+
+def find_files(source):
+    """
+    :param source: directory or glob pattern
+    :return: sorted .npz and .csv results files
+    """
+    if os.path.isdir(source):
+        source = os.path.join(source, '*')
+    return sorted(f for f in glob.glob(source)
+                  if f.endswith('.npz') or f.endswith('.csv'))
@@ -0,0 +1,51 @@
+#! python
+# -*- coding: utf-8 -*-
+"""
+Periodic spline smoothing of crank angle curves.
+
+Every column of a run is fitted in one call, as a 2-D y, with periodic
+boundary conditions since the data is a 0 - 360 degree cycle. The fitted
+spline is returned so values and derivatives can be evaluated later without
+refitting.
+"""
+from functools import lru_cache
+import numpy as np
+from scipy.interpolate import make_interp_spline
+
+PERIOD = 360
+
+
+@lru_cache(maxsize=32)
+def grid(start, stop, resolution):
+    """Evaluation grid, shared by every fit over the same range"""
+    xnew = np.linspace(start, stop, resolution)
+    xnew.flags.writeable = False
+    return xnew
+
+
+def fit(x_val, y_val):
+    """
+    :param x_val: (n,) crank angles in degrees, increasing
+    :param y_val: (n,) or (k, n) - one row per curve
+    :return: cubic spline of all rows, periodic if x_val spans a full cycle
+    """
+    x_val = np.asarray(x_val, dtype=float)
+    y_val = np.array(y_val, dtype=float)
+    if x_val[-1] - x_val[0] == PERIOD:
+        # Ends must match exactly for a periodic fit
+        y_val[..., -1] = y_val[..., 0]
+        return make_interp_spline(x_val, y_val, 3, bc_type='periodic',
+                                  axis=-1)
+    return make_interp_spline(x_val, y_val, 3, axis=-1)
+
+
+def smooth_curves(x_val, y_val, resolution=100):
+    """
+    :param x_val: (n,) crank angles in degrees
+    :param y_val: (n,) or (k, n) - one row per curve
+    :param resolution: number of points in the smoothed curves
+    :return: xnew, ynew with one row per curve, spline
+    """
+    spline = fit(x_val, y_val)
+    xnew = grid(float(x_val[0]), float(x_val[-1]), resolution)
+    return xnew, spline(xnew), spline
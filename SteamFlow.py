@@ -0,0 +1,179 @@
+#!/usr/bin/python3.6
+"""
+Steam port flow and synthetic indicator diagrams.
+
+Valve displacement d from mid travel, positive the way that opens the head
+end steam port (see ValveEvents.HEAD_PORT), gives each end's port openings,
+    head end    steam d - lap,      exhaust -d - exhaust_lap
+    crank end   steam -d - lap,     exhaust d - exhaust_lap
+clipped to 0 and the port length and times the port width for the area.
+Steam flows through them as compressible flow through an orifice (choked
+below the critical pressure ratio) between the steam chest, each end of the
+cylinder and the exhaust. The cylinder is modelled isothermally at the
+supply temperature, and its pressure integrated through the crank cycle,
+the first cycle settling the model and the last recorded. Reverse gear rows
+(see ValveEvents.reverse_gear) are integrated with the crank turning
+backwards. The indicated work per cycle is the integral of p dV in the
+direction the engine runs.
+
+Every engine speed and cutoff is integrated at once, as arrays of shape
+(rpm, cutoff, end).
+
+    python3 SteamFlow.py Results/Test.npz --rpm 500 1000 2000
+"""
+import argparse
+from collections import namedtuple
+import numpy as np
+import ResultsFile
+from Smoothing import fit
+from ValveEvents import HEAD_PORT, displacement, reverse_gear
+
+# Nominal engine and steam data, SI units. Override with geometry=dict(...)
+GEOMETRY = {
+    'bore': 0.022,
+    'clearance': 0.10,          # fraction of swept volume
+    'port_width': 0.010,
+    'port_length': 0.0025,      # largest usable opening
+    'lap': 0.002,
+    'exhaust_lap': 0.0,
+    'centre': 150.0,            # valve position at mid travel, mm
+    'head_port': HEAD_PORT,
+    'supply_pressure': 4.0e5,
+    'exhaust_pressure': 1.013e5,
+    'temperature': 430.0,
+    'discharge': 0.7,
+    'gamma': 1.3,
+    'gas_constant': 461.5,
+}
+
+Indicator = namedtuple('Indicator', [
+    'rpm', 'crank', 'volume', 'pressure', 'work', 'power'])
+
+
+def orifice(area, p_up, p_down, g):
+    """
+    Mass flow from p_up to p_down through area, kg/s - negative if the flow
+    is the other way
+    """
+    gamma = g['gamma']
+    sign = np.where(p_up >= p_down, 1.0, -1.0)
+    high = np.maximum(p_up, p_down)
+    ratio = np.minimum(p_up, p_down) / high
+    critical = (2 / (gamma + 1)) ** (gamma / (gamma - 1))
+    ratio = np.maximum(ratio, critical)
+    psi = np.sqrt(2 * gamma / ((gamma - 1) * g['gas_constant'] *
+                               g['temperature']) *
+                  (ratio ** (2 / gamma) - ratio ** ((gamma + 1) / gamma)))
+    return sign * g['discharge'] * area * high * psi
+
+
+def ports(valve, g):
+    """
+    :param valve: (k, n) valve displacement from mid travel, m, positive
+    towards opening the head end steam port
+    :return: steam and exhaust port areas, each (k, 2, n) - head end, crank
+    end
+    """
+    def area(opening):
+        return g['port_width'] * np.clip(opening, 0, g['port_length'])
+    steam = np.stack([area(valve - g['lap']), area(-valve - g['lap'])], 1)
+    exhaust = np.stack([area(-valve - g['exhaust_lap']),
+                        area(valve - g['exhaust_lap'])], 1)
+    return steam, exhaust
+
+
+def volumes(piston, g):
+    """
+    :param piston: (n,) piston position through the cycle, m
+    :return: (2, n) head and crank end volumes, m^3
+    """
+    x = np.abs(piston - piston[0])
+    stroke = x.max()
+    area = np.pi * g['bore'] ** 2 / 4
+    clearance = g['clearance'] * stroke
+    return area * np.stack([clearance + x, clearance + stroke - x])
+
+
+def simulate(results, rpm, geometry=None, steps=360, cycles=2):
+    """
+    :param results: ResultsFile.Results of a full cycle
+    :param rpm: engine speeds
+    :param steps: integration steps per crank revolution
+    :return: Indicator - volume (2, n) m^3 and pressure (rpm, cutoff, 2, n)
+    Pa of the last cycle, both in crank angle order, indicated work per
+    cycle (rpm, cutoff, 2) J and indicated power (rpm, cutoff) W
+    """
+    g = dict(GEOMETRY, **(geometry or {}))
+    crank = np.linspace(results.crank[0], results.crank[-1], steps + 1)
+    curves = fit(results.crank, np.vstack([results.piston,
+                                           results.valve]))(crank)
+    volume = volumes(curves[0] / 1000, g)
+    steam, exhaust = ports(displacement(curves[1:], g['centre'],
+                                        g['head_port']) / 1000, g)
+    # Step order of each cutoff through the arrays - backwards in reverse
+    # gear. Reversing is its own inverse, so it also maps back.
+    order = np.where(reverse_gear(results.header)[:, np.newaxis],
+                     np.arange(steps, -1, -1), np.arange(steps + 1))
+    steam = np.take_along_axis(steam, order[:, np.newaxis], -1)
+    exhaust = np.take_along_axis(exhaust, order[:, np.newaxis], -1)
+    run = volume[:, order].transpose(1, 0, 2)
+    rpm = np.asarray(rpm, dtype=float)
+    # Seconds per step, broadcast over (rpm, cutoff, end)
+    dt = (60 / rpm / steps)[:, np.newaxis, np.newaxis]
+    rt = g['gas_constant'] * g['temperature']
+    p_s, p_e = g['supply_pressure'], g['exhaust_pressure']
+    p = np.full((len(rpm), len(steam), 2), p_e)
+    pressure = np.empty(p.shape + (steps + 1,))
+    for cycle in range(cycles):
+        for i in range(steps + 1):
+            pressure[..., i] = p
+            if i == steps:
+                break
+            scale = dt * rt / run[..., i]
+            # Flow can't carry the pressure past the far side's
+            inflow = orifice(steam[:, :, i], p_s, p, g) * scale
+            inflow = np.sign(inflow) * np.minimum(np.abs(inflow),
+                                                  np.abs(p_s - p))
+            outflow = orifice(exhaust[:, :, i], p, p_e, g) * scale
+            outflow = np.sign(outflow) * np.minimum(np.abs(outflow),
+                                                    np.abs(p - p_e))
+            # Isothermal change of volume to the next step
+            p = (p + inflow - outflow) * run[..., i] / run[..., i + 1]
+    work = (0.5 * (pressure[..., 1:] + pressure[..., :-1]) *
+            np.diff(run, axis=-1)).sum(axis=-1)
+    pressure = np.take_along_axis(pressure, order[np.newaxis, :, np.newaxis],
+                                  -1)
+    power = work.sum(axis=-1) * rpm[:, np.newaxis] / 60
+    return Indicator(rpm, crank, volume, pressure, work, power)
+
+
+def print_work(indicator, names):
+    print('{:>8}{:>6}{:>12}{:>12}{:>10}'.format(
+        'RPM', 'GEAR', 'HEAD J', 'CRANK J', 'POWER W'))
+    for i, rpm in enumerate(indicator.rpm):
+        for k, name in enumerate(names):
+            head, crank = indicator.work[i, k]
+            print('{:>8.0f}{:>6}{:>12.4f}{:>12.4f}{:>10.2f}'.format(
+                rpm, name, head, crank, indicator.power[i, k]))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Port flow and indicated work from a results file')
+    parser.add_argument('file', help='.npz or .csv results file')
+    parser.add_argument('--rpm', nargs='+', type=float,
+                        default=[500, 1000, 2000])
+    for name in ('supply_pressure', 'bore', 'port_width', 'lap'):
+        parser.add_argument('--' + name.replace('_', '-'), type=float,
+                            default=GEOMETRY[name], dest=name,
+                            help='SI units')
+    args = parser.parse_args()
+    results = ResultsFile.load(args.file)
+    geometry = {name: getattr(args, name) for name in
+                ('supply_pressure', 'bore', 'port_width', 'lap')}
+    print_work(simulate(results, args.rpm, geometry),
+               results.header['names'])
+
+
+if __name__ == "__main__":
+    main()
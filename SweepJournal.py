@@ -0,0 +1,151 @@
+#! python
+# -*- coding: utf-8 -*-
+"""
+Crash-safe sweep journal.
+
+Solved poses are appended to part files as they are produced, flushed and
+fsynced every few rows, alongside a manifest describing the run. A sweep that
+dies part way through can then be resumed, solving only the (cutoff, crank
+angle) pairs that aren't on disk yet.
+
+Journal layout, next to the output file:
+    <output>.journal/manifest.json
+    <output>.journal/part<n>.csv    cutoff, crank angle, piston, valve,
+                                    eccentric z, eccentric x
+"""
+import csv
+import json
+import os
+import time
+from glob import glob
+
+FIELDS = 6
+
+
+def journal_dir(output):
+    return output + '.journal'
+
+
+def write_json(fname, data):
+    """Writes via a temporary file so a crash never leaves half a file"""
+    tmp = fname + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, fname)
+
+
+def read_part(fname):
+    """
+    Rows of a part file, skipping a partly written last row
+    """
+    with open(fname, newline='') as csv_file:
+        lines = [line for line in csv_file if line.endswith('\n')]
+    return [row for row in csv.reader(lines, quoting=csv.QUOTE_NONNUMERIC)
+            if len(row) == FIELDS]
+
+
+class PartWriter(object):
+    """
+    Appends rows to one part file, fsyncing every flush_every rows
+    """
+
+    def __init__(self, fname, flush_every=10):
+        self.file = open(fname, 'a', newline='')
+        self.writer = csv.writer(self.file, quoting=csv.QUOTE_NONNUMERIC)
+        self.flush_every = flush_every
+        self.unflushed = 0
+
+    def write(self, row):
+        self.writer.writerow(row)
+        self.unflushed += 1
+        if self.unflushed >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unflushed = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class SweepJournal(object):
+    """
+    :param output: results file the sweep is for
+    :param cutoffs: radius link angles, as given to the sweep
+    :param angles: crank angles
+    :param model: model hash (see PoseCache.model_hash)
+    :param resume: keep what an earlier run of the same sweep wrote,
+    otherwise start again
+    """
+
+    def __init__(self, output, cutoffs, angles, model, resume=False):
+        self.dir = journal_dir(output)
+        self.manifest_file = os.path.join(self.dir, 'manifest.json')
+        self.manifest = {'output': os.path.basename(output),
+                         'model': model,
+                         'cutoffs': [str(c) for c in cutoffs],
+                         'angles': list(angles),
+                         'status': 'running',
+                         'started': time.strftime('%Y-%m-%d %H:%M:%S')}
+        os.makedirs(self.dir, exist_ok=True)
+        if resume and os.path.exists(self.manifest_file):
+            with open(self.manifest_file) as f:
+                previous = json.load(f)
+            for key in ('model', 'cutoffs', 'angles'):
+                if previous[key] != self.manifest[key]:
+                    raise ValueError('cannot resume - {} differs from the '
+                                     'journalled run'.format(key))
+            self.manifest['started'] = previous['started']
+        else:
+            for part in self.parts():
+                os.remove(part)
+        write_json(self.manifest_file, self.manifest)
+
+    def parts(self):
+        return sorted(glob(os.path.join(self.dir, 'part*.csv')))
+
+    def new_parts(self, n):
+        """Names for n part files not used yet"""
+        start = len(self.parts())
+        return [os.path.join(self.dir, 'part{}.csv'.format(start + i))
+                for i in range(n)]
+
+    def writer(self, flush_every=10):
+        return PartWriter(self.new_parts(1)[0], flush_every)
+
+    def rows(self):
+        """
+        All journalled rows, one per (cutoff, crank angle)
+        """
+        solved = {}
+        for part in self.parts():
+            for row in read_part(part):
+                solved[(str(row[0]), row[1])] = row
+        return list(solved.values())
+
+    def done(self):
+        return {(str(row[0]), row[1]) for row in self.rows()}
+
+    def pending(self):
+        """
+        :return: {cutoff: crank angles not solved yet}, cutoffs with
+        nothing left to solve omitted
+        """
+        done = self.done()
+        todo = {}
+        for cutoff in self.manifest['cutoffs']:
+            angles = [a for a in self.manifest['angles']
+                      if (cutoff, a) not in done]
+            if angles:
+                todo[cutoff] = angles
+        return todo
+
+    def complete(self):
+        self.manifest['status'] = 'complete'
+        self.manifest['finished'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        write_json(self.manifest_file, self.manifest)
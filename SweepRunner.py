@@ -0,0 +1,146 @@
+#!/usr/bin/python3.6
+"""
+Command-line sweep driver. Splits the (cutoff angle, crank angle) grid over a
+pool of headless FreeCADCmd processes running SweepWorker.py, then merges
+their output into one results file (see ResultsFile).
+
+Workers journal their rows as they go (see SweepJournal), so an interrupted
+sweep can be finished with --resume, solving only what is missing.
+
+    python3 SweepRunner.py Results/Test.npz 75 90 115 --workers 8
+    python3 SweepRunner.py Results/Test.npz 75 90 115 --resume
+"""
+import argparse
+import json
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import Harmonics
+from PoseCache import model_hash
+from Profiler import Profiler
+import ResultsFile
+from SweepJournal import SweepJournal
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+MODEL = os.path.join(DIRECTORY, 'ValveGear_Z7S.FCStd')
+WORKER = os.path.join(DIRECTORY, 'SweepWorker.py')
+
+
+def split_grid(grid, workers):
+    """
+    Divides the grid into at most 'workers' slices. Each cutoff is kept
+    within as few slices as possible, as every change of cutoff costs a
+    recompute in the worker.
+    :param grid: {cutoff: crank angles to solve}
+    :return: list of slices, each a list of [cutoff, angles]
+    """
+    chunks = max(1, -(-workers // len(grid)))
+    pieces = []
+    for cutoff, angles in grid.items():
+        size = -(-len(angles) // chunks)
+        pieces += [[cutoff, angles[i:i + size]]
+                   for i in range(0, len(angles), size)]
+    slices = [[] for _ in range(min(workers, len(pieces)))]
+    for i, piece in enumerate(pieces):
+        slices[i % len(slices)].append(piece)
+    return slices
+
+
+def run_worker(freecad, job):
+    job_file = job['output'][:-len('.csv')] + '.json'
+    with open(job_file, 'w') as f:
+        json.dump(job, f)
+    env = dict(os.environ, FIRTH_SWEEP_JOB=job_file)
+    try:
+        subprocess.run([freecad, WORKER], env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+    finally:
+        os.remove(job_file)
+
+
+def merge(results, cutoffs, angles):
+    """
+    Merges worker rows into crank angle, piston, valve per cutoff, [z, x]
+    per cutoff rows. Piston position does not depend on cutoff, so it is
+    taken from whichever cutoff solved that angle first.
+    """
+    solved = {}
+    for cutoff, angle, ppos, vpos, ecc_z, ecc_x in results:
+        solved[(cutoff, angle)] = (ppos, vpos, [ecc_z, ecc_x])
+    rows = []
+    for angle in angles:
+        poses = [solved[(cutoff, angle)] for cutoff in cutoffs]
+        rows.append([angle, poses[0][0]] + [p[1] for p in poses] +
+                    [p[2] for p in poses])
+    return rows
+
+
+def sweep(output, cutoffs, angles, workers, freecad='FreeCADCmd',
+          model=MODEL, resume=False, trace=None):
+    """
+    :param output: .npz results file, or .csv to export
+    :param resume: only solve the poses an interrupted run of the same
+    sweep didn't journal
+    :param trace: Chrome trace file for the phase timings, if wanted
+    """
+    profiler = Profiler()
+    journal = SweepJournal(output, cutoffs, angles, model_hash(model), resume)
+    grid = journal.pending()
+    if grid:
+        slices = split_grid(grid, workers)
+        jobs = [{'model': model, 'slices': s, 'output': part}
+                for s, part in zip(slices, journal.new_parts(len(slices)))]
+        print('SOLVING', sum(len(a) for a in grid.values()), 'POSES')
+
+        def timed_worker(job):
+            poses = sum(len(a) for _, a in job['slices'])
+            with profiler.phase('worker', poses=poses,
+                                cutoffs=[c for c, _ in job['slices']]):
+                run_worker(freecad, job)
+
+        with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+            futures = [pool.submit(timed_worker, job) for job in jobs]
+            failed = [f.exception() for f in futures if f.exception()]
+        if failed:
+            profiler.count('worker_failed', len(failed))
+            print('SWEEP INCOMPLETE - RUN AGAIN WITH --resume')
+            raise failed[0]
+    with profiler.phase('merge'):
+        header = ResultsFile.make_header(cutoffs, model=model_hash(model))
+        merged = ResultsFile.from_rows(merge(journal.rows(), cutoffs, angles),
+                                       header)
+    with profiler.phase('write_file'):
+        if output.endswith('.csv'):
+            ResultsFile.export_csv(output, merged)
+        else:
+            ResultsFile.save(output, merged, Harmonics.for_results(merged))
+    journal.complete()
+    print("FILE WRITTEN", output)
+    profiler.print_summary(key=None)
+    if trace:
+        profiler.chrome_trace(trace)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Headless parallel FreeCAD valve gear sweep')
+    parser.add_argument('output', help='.npz results file, or .csv export')
+    parser.add_argument('cutoffs', nargs='*', default=['75', '90', '115'],
+                        help='radius link angles (default fwd, mid, rev)')
+    parser.add_argument('--step', type=int, default=10,
+                        help='crank angle step in degrees')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--freecad', default='FreeCADCmd',
+                        help='FreeCADCmd executable')
+    parser.add_argument('--model', default=MODEL)
+    parser.add_argument('--resume', action='store_true',
+                        help='finish an interrupted sweep of the same grid')
+    parser.add_argument('--trace', help='write a Chrome trace of the run')
+    args = parser.parse_args()
+    angles = list(range(0, 360 + args.step, args.step))
+    sweep(args.output, args.cutoffs, angles, args.workers, args.freecad,
+          args.model, args.resume, args.trace)
+
+
+if __name__ == "__main__":
+    main()
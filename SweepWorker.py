@@ -0,0 +1,73 @@
+#! python
+# -*- coding: utf-8 -*-
+"""
+Headless sweep worker, run by SweepRunner.py inside FreeCADCmd:
+
+    FIRTH_SWEEP_JOB=job.json FreeCADCmd SweepWorker.py
+
+The job file gives the model, the (cutoff angle, crank angles) slice to solve
+and the .csv file to append to. Each output row is
+cutoff, crank angle, piston, valve, eccentric z, eccentric x
+read as floats from the Constraint019 - 022 Distance properties, as
+ControlPanel does (see Measurement). Rows are flushed to disk every few
+solves, so a crashed worker loses at most a few (see SweepJournal).
+"""
+import csv
+import json
+import os
+import FreeCAD as App
+
+
+def get_solver():
+    try:
+        from freecad.asm3 import solver
+    except ImportError:
+        from asm3 import solver
+    return solver
+
+
+def set_cutoff(doc, angle):
+    doc.getObject('Sketch004').setDatum(
+        5, App.Units.Quantity(str(angle) + ' deg'))
+    doc.recompute()
+
+
+def find_driver(doc):
+    for each in doc.Objects:
+        if each.Label.endswith("Driver"):
+            return each
+    raise RuntimeError("No driver found!")
+
+
+def measure(doc):
+    """
+    :return: piston, valve, eccentric z, eccentric x, full precision floats
+    """
+    return tuple(getattr(doc, name).Distance.Value for name in
+                 ('Constraint019', 'Constraint020', 'Constraint022',
+                  'Constraint021'))
+
+
+def run_job(job):
+    doc = App.openDocument(job['model'])
+    driver = find_driver(doc)
+    solver = get_solver()
+    flush_every = job.get('flush_every', 10)
+    with open(job['output'], 'a', newline='') as csv_file:
+        writer = csv.writer(csv_file, quoting=csv.QUOTE_NONNUMERIC)
+        solved = 0
+        for cutoff, angles in job['slices']:
+            set_cutoff(doc, cutoff)
+            for angle in angles:
+                driver.Angle = angle
+                solver.solve()
+                writer.writerow([cutoff, angle] + list(measure(doc)))
+                solved += 1
+                if solved % flush_every == 0:
+                    csv_file.flush()
+                    os.fsync(csv_file.fileno())
+    App.closeDocument(doc.Name)
+
+
+with open(os.environ['FIRTH_SWEEP_JOB']) as job_file:
+    run_job(json.load(job_file))
@@ -0,0 +1,150 @@
+#!/usr/bin/python3.6
+"""
+Valve travel map - valve displacement from mid travel over a dense, even
+(cutoff angle x crank angle) grid.
+
+The grid is generated a chunk of cutoff rows at a time straight into a .npy
+memmap, with a JSON sidecar recording the axes and how many rows are done,
+so memory use stays bounded however big the grid is and Analyser can show
+the map while it is still being written.
+
+    python3 TravelMap.py Results/map.npy --cutoffs 60 120 601 --step 0.1
+    python3 Analyser.py --map Results/map.npy
+"""
+import argparse
+import json
+import os
+import numpy as np
+import FirthKinematics
+
+
+def header_file(fname):
+    return fname + '.json'
+
+
+def axes(header):
+    """:return: cutoff angles, crank angles"""
+    return (np.linspace(*header['cutoffs']), np.linspace(*header['crank']))
+
+
+def write_header(fname, header):
+    tmp = header_file(fname) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(header, f)
+    os.replace(tmp, header_file(fname))
+
+
+def read_header(fname):
+    with open(header_file(fname)) as f:
+        return json.load(f)
+
+
+def analytic_travel(dims=FirthKinematics.DEFAULT_DIMENSIONS, centre=150.0):
+    """
+    :return: callable(cutoffs, crank) -> (cutoffs, crank) valve displacement
+    from the closed-form model
+    """
+    def travel(cutoffs, crank):
+        valve, _, _ = FirthKinematics.link_positions(crank, cutoffs, dims)
+        return valve - centre
+    return travel
+
+
+def generate(fname, cutoffs, crank, travel=None, chunk_cells=1 << 20,
+             model='analytic'):
+    """
+    :param fname: .npy file to write
+    :param cutoffs: (start, stop, count) of the cutoff axis, degrees
+    :param crank: (start, stop, count) of the crank axis, degrees
+    :param travel: callable(cutoffs, crank) -> displacement, see
+    analytic_travel()
+    :param chunk_cells: grid cells computed at once
+    """
+    travel = travel or analytic_travel()
+    header = {'cutoffs': list(cutoffs), 'crank': list(crank),
+              'rows_done': 0, 'model': model}
+    cutoff_axis, crank_axis = axes(header)
+    grid = np.lib.format.open_memmap(
+        fname, mode='w+', dtype=np.float32,
+        shape=(len(cutoff_axis), len(crank_axis)))
+    write_header(fname, header)
+    rows = max(1, chunk_cells // len(crank_axis))
+    for start in range(0, len(cutoff_axis), rows):
+        stop = min(start + rows, len(cutoff_axis))
+        grid[start:stop] = travel(cutoff_axis[start:stop], crank_axis)
+        grid.flush()
+        header['rows_done'] = stop
+        write_header(fname, header)
+        print('ROWS', stop, 'OF', len(cutoff_axis))
+    del grid
+    print("FILE WRITTEN", fname)
+
+
+class TravelMap(object):
+    """
+    Reads a map back progressively, decimated to at most max_cells for
+    display
+    """
+
+    def __init__(self, fname, max_cells=4 << 20):
+        self.fname = fname
+        self.grid = np.load(fname, mmap_mode='r')
+        self.header = read_header(fname)
+        self.cutoffs, self.crank = axes(self.header)
+        k, n = self.grid.shape
+        stride = max(1, int(np.ceil(np.sqrt(k * n / max_cells))))
+        self.row_stride = min(stride, k)
+        self.col_stride = min(stride, n)
+        self.image = np.full((-(-k // self.row_stride),
+                              -(-n // self.col_stride)), np.nan,
+                             dtype=np.float32)
+        self.rows_loaded = 0
+
+    def extent(self):
+        """:return: crank start, cutoff start, crank span, cutoff span"""
+        return (self.crank[0], self.cutoffs[0],
+                self.crank[-1] - self.crank[0],
+                self.cutoffs[-1] - self.cutoffs[0])
+
+    def is_loaded(self):
+        return self.rows_loaded >= len(self.cutoffs)
+
+    def load_next(self, rows=64):
+        """
+        Loads up to rows more display rows of whatever has been written
+        :return: True if anything new was loaded
+        """
+        done = read_header(self.fname)['rows_done']
+        start = self.rows_loaded
+        stop = min(start + rows * self.row_stride, done)
+        if stop <= start:
+            return False
+        first = -(-start // self.row_stride)
+        block = self.grid[first * self.row_stride:stop:self.row_stride,
+                          ::self.col_stride]
+        self.image[first:first + len(block)] = block
+        self.rows_loaded = stop
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Valve travel over a dense cutoff x crank angle grid '
+                    '(closed-form model)')
+    parser.add_argument('output', help='.npy file')
+    parser.add_argument('--cutoffs', nargs=3, type=float,
+                        default=[60, 120, 601],
+                        metavar=('START', 'STOP', 'COUNT'))
+    parser.add_argument('--step', type=float, default=0.1,
+                        help='crank angle step in degrees')
+    parser.add_argument('--centre', type=float, default=150.0,
+                        help='valve position at mid travel')
+    args = parser.parse_args()
+    count = int(round(360 / args.step)) + 1
+    cutoffs = args.cutoffs[:2] + [int(args.cutoffs[2])]
+    generate(args.output, cutoffs, [0.0, 360.0, count],
+             analytic_travel(centre=args.centre))
+
+
+if __name__ == "__main__":
+    main()
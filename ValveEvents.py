@@ -0,0 +1,221 @@
+#!/usr/bin/python3.6
+"""
+Valve event extraction.
+
+Finds, for both cylinder ends and every cutoff, the crank angle and
+percentage of piston stroke at admission, cutoff, release and compression,
+plus lead and maximum port opening. Events are where the valve displacement
+crosses the steam lap (the +/-2 lines Analyser marks with InspectorLine_y) or
+the exhaust lap, found by vectorized root finding on the smoothed curves for
+all cutoffs at once.
+
+With displacement d from mid travel, positive the way that opens the head
+end steam port (see HEAD_PORT), steam lap L and exhaust lap E:
+    head end    admission d rises through +L, cutoff d falls through +L,
+                release d falls through -E, compression d rises through -E
+    crank end   admission d falls through -L, cutoff d rises through -L,
+                release d rises through +E, compression d falls through +E
+Head end events are measured as a percentage of the stroke from the dead
+centre at 0 degrees, crank end events from the other dead centre. Reverse
+gear rows are timed with the crank turning backwards.
+
+    python3 ValveEvents.py Results/ --out events.csv
+"""
+import argparse
+import csv
+import os
+import numpy as np
+import ResultsFile
+from Smoothing import fit
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+EVENTS = ('admission', 'cutoff', 'release', 'compression')
+# Direction of valve travel, as a sign on its measured position, that opens
+# the head end steam port. The model's valve is 1.55 mm short of mid travel
+# at head dead centre (crank 0) in forward gear, i.e. it has moved that way
+# to give the head end its lead, so the head port opens as it comes in.
+HEAD_PORT = -1
+ENDS = ('head', 'crank')
+
+
+def crossings(x, y, level, rising):
+    """
+    First crossing of a level along the last axis, by linear interpolation
+    between samples
+    :param x: (n,) increasing
+    :param y: (..., n)
+    :param level: scalar or array broadcastable to y[..., 0]
+    :param rising: True for upward crossings, False for downward
+    :return: (...) crossing positions, NaN where there is none
+    """
+    s = y - np.expand_dims(level, -1)
+    if rising:
+        mask = (s[..., :-1] < 0) & (s[..., 1:] >= 0)
+    else:
+        mask = (s[..., :-1] > 0) & (s[..., 1:] <= 0)
+    i = np.argmax(mask, axis=-1)
+    s0 = np.take_along_axis(s, i[..., np.newaxis], -1)[..., 0]
+    s1 = np.take_along_axis(s, i[..., np.newaxis] + 1, -1)[..., 0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        root = x[i] + s0 / (s0 - s1) * (x[i + 1] - x[i])
+    return np.where(mask.any(axis=-1), root, np.nan)
+
+
+def valve_events(crank, piston, valve, lap=2.0, exhaust_lap=0.0,
+                 reverse=False):
+    """
+    :param crank: (n,) crank angles, 0 - 360, finely and evenly sampled
+    :param piston: (n,) piston position
+    :param valve: (..., n) valve displacement from mid travel
+    :param lap: steam lap
+    :param exhaust_lap: exhaust lap
+    :param reverse: True if the engine runs backwards, i.e. the valve rows
+    are in reverse gear. May also be an array with one value per valve row.
+    :return: dict of arrays shaped like valve[..., 0], keyed
+    '<end>_<event>_angle', '<end>_<event>_pct', '<end>_lead' and
+    '<end>_max_opening'
+    """
+    crank = np.asarray(crank, dtype=float)
+    piston = np.asarray(piston, dtype=float)
+    valve = np.asarray(valve, dtype=float)
+    reverse = np.asarray(reverse)
+    if reverse.any():
+        # Run the cycle backwards, then map the angles back
+        turned = crank[0] + crank[-1] - crank[::-1]
+        backward = valve_events(turned, piston[::-1], valve[..., ::-1], lap,
+                                exhaust_lap)
+        for name in backward:
+            if name.endswith('_angle'):
+                backward[name] = crank[0] + crank[-1] - backward[name]
+        if reverse.all():
+            return backward
+        forward = valve_events(crank, piston, valve, lap, exhaust_lap)
+        return {name: np.where(reverse, backward[name], forward[name])
+                for name in forward}
+    stroke = piston.max() - piston.min()
+    # Dead centres - the head end one is the extreme the crank starts at
+    first, second = np.argmax(piston), np.argmin(piston)
+    if abs(piston[0] - piston[second]) < abs(piston[0] - piston[first]):
+        first, second = second, first
+    dead_centres = {'head': first, 'crank': second}
+    levels = {'head': {'admission': (lap, True), 'cutoff': (lap, False),
+                       'release': (-exhaust_lap, False),
+                       'compression': (-exhaust_lap, True)},
+              'crank': {'admission': (-lap, False), 'cutoff': (-lap, True),
+                        'release': (exhaust_lap, True),
+                        'compression': (exhaust_lap, False)}}
+    sign = {'head': 1, 'crank': -1}
+    events = {}
+    for end in ENDS:
+        dc = dead_centres[end]
+        for event in EVENTS:
+            level, rising = levels[end][event]
+            angle = crossings(crank, valve, level, rising)
+            events[end + '_' + event + '_angle'] = angle
+            events[end + '_' + event + '_pct'] = 100 * np.abs(
+                np.interp(angle, crank, piston) - piston[dc]) / stroke
+        opening = sign[end] * valve - lap
+        events[end + '_lead'] = opening[..., dc]
+        events[end + '_max_opening'] = opening.max(axis=-1)
+    return events
+
+
+def displacement(valve, centre=150.0, head_port=HEAD_PORT):
+    """
+    :param valve: measured valve positions
+    :param centre: valve position at mid travel
+    :return: valve displacement from mid travel, positive towards opening
+    the head end steam port
+    """
+    return head_port * (np.asarray(valve, dtype=float) - centre)
+
+
+def reverse_gear(header, mid=90.0):
+    """
+    Which valve rows of a run are in reverse gear - cutoffs past mid gear,
+    or rows named Rev when the cutoff angles aren't known
+    """
+    return np.array([c > mid if c is not None else name == 'Rev'
+                     for c, name in zip(header['cutoffs'], header['names'])])
+
+
+def results_events(results, lap=2.0, exhaust_lap=0.0, centre=150.0,
+                   step=0.1, head_port=HEAD_PORT):
+    """
+    Valve events of every cutoff in a run, from its smoothed curves
+    :param results: ResultsFile.Results
+    :param centre: valve position at mid travel (see
+    Analyser.centre_positions)
+    :param step: crank angle step the smoothed curves are evaluated at
+    :param head_port: see HEAD_PORT
+    :return: dict of arrays, one value per cutoff - see valve_events()
+    """
+    spline = fit(results.crank, np.vstack([results.piston, results.valve]))
+    crank = np.arange(results.crank[0], results.crank[-1] + step / 2, step)
+    curves = spline(crank)
+    return valve_events(crank, curves[0],
+                        displacement(curves[1:], centre, head_port), lap,
+                        exhaust_lap, reverse_gear(results.header))
+
+
+def columns():
+    names = ['file', 'name', 'cutoff']
+    for end in ENDS:
+        for event in EVENTS:
+            names += [end + '_' + event + '_angle', end + '_' + event + '_pct']
+        names += [end + '_lead', end + '_max_opening']
+    return names
+
+
+def summary(files, lap=2.0, exhaust_lap=0.0, centre=150.0,
+            head_port=HEAD_PORT):
+    """
+    Files that can't be read as results, e.g. an earlier events.csv, are
+    reported and left out
+    :return: rows of the summary table, one per file and cutoff
+    """
+    names = columns()
+    table = []
+    for fname in files:
+        try:
+            results = ResultsFile.load(fname)
+            events = results_events(results, lap, exhaust_lap, centre,
+                                    head_port=head_port)
+        except Exception as e:
+            print('SKIPPED', fname, '{}: {}'.format(type(e).__name__, e))
+            continue
+        for i, (name, cutoff) in enumerate(zip(results.header['names'],
+                                               results.header['cutoffs'])):
+            row = [os.path.basename(fname), name, cutoff]
+            row += [round(float(events[n][i]), 3) for n in names[3:]]
+            table.append(row)
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Valve event summary for results files')
+    parser.add_argument('source', nargs='?',
+                        default=os.path.join(DIRECTORY, 'Results'),
+                        help='directory or glob of .npz/.csv results')
+    parser.add_argument('--out', default='events.csv')
+    parser.add_argument('--lap', type=float, default=2.0)
+    parser.add_argument('--exhaust-lap', type=float, default=0.0)
+    parser.add_argument('--centre', type=float, default=150.0,
+                        help='valve position at mid travel')
+    parser.add_argument('--head-port', type=int, default=HEAD_PORT,
+                        choices=[1, -1],
+                        help='sign of the valve travel that opens the head '
+                             'end steam port')
+    args = parser.parse_args()
+    table = summary(ResultsFile.find_files(args.source), args.lap,
+                    args.exhaust_lap, args.centre, args.head_port)
+    with open(args.out, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(columns())
+        writer.writerows(table)
+    print("FILE WRITTEN", args.out)
+
+
+if __name__ == "__main__":
+    main()
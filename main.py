@@ -1,14 +1,14 @@
 from PyQt5 import QtWidgets, QtGui, QtCore
 from pyqtgraph import PlotWidget, plot
 import pyqtgraph as pg
-import csv
 import sys  # We need sys so that we can pass argv to QApplication
 #sys.path.append('../')
 import os
 import numpy as np
 from sklearn import preprocessing
-from scipy.interpolate import make_interp_spline
 from InspectorLine import InspectorLine
+import ResultsFile
+from Smoothing import smooth_curves
 
 
 FILENAME_0 = '/001_mid.csv'
@@ -72,44 +72,16 @@ class MainWindow(QtWidgets.QMainWindow):
         self.get_curves(FILENAME_0, self.graphWidget_0)
         self.get_curves(FILENAME_1, self.graphWidget_1)
 
-    def get_crank_degrees(self):
-        crank_angle = []
-        with open(self.directory + FILENAME_0) as csv_file:
-            csv_reader = csv.reader(csv_file, delimiter=',',
-                                    quoting=csv.QUOTE_NONNUMERIC)
-            line_count = 0
-            for row in csv_reader:
-                crank_angle.append(row[0])
-                line_count += 1
-        #crank_angle = self.normalize_position_data(crank_angle)
-        return crank_angle
-
     def get_curves(self, fname, graphwidget):
-        """Reads .csv file and fills lists for pyqtgraph.
-        Row 0 = crankshaft degrees, 1 = piston position, 2 = valve position at
-        mid-gear, 3 = valve position forward, 4 = valve position reverse"""
-        crank_angle = self.get_crank_degrees()
-        cutoff_mid = []
-        cutoff_fwd = []
-        cutoff_rev = []
-        piston_x = []
-
-        with open(self.directory + fname) as csv_file:
-            csv_reader = csv.reader(csv_file, quoting=csv.QUOTE_NONNUMERIC)
-            line_count = 0
-            for row in csv_reader:
-                piston_pos = row[1]
-                piston_pos = piston_pos[:-3]
-                piston_x.append(piston_pos)
-                valve_pos = row[2]
-                valve_pos = valve_pos[:-3]
-                cutoff_mid.append(valve_pos)
-                #cutoff_rev.append(row[4])
-                line_count += 1
-        piston_x = self.normalize_position_data(piston_x)
-        piston_x = self.smooth_curves(crank_angle, piston_x)
+        """Loads a results file (see ResultsFile) and plots the first valve
+        row"""
+        results = ResultsFile.load(self.directory + fname)
+        crank_angle = results.crank
+        piston_x = self.normalize_position_data(results.piston)
         #cutoff_mid = self.normalize_position_data(cutoff_mid)
-        mid = self.smooth_curves(crank_angle, cutoff_mid)
+        xnew, ynew, _ = smooth_curves(crank_angle,
+                                      [piston_x, results.valve[0]])
+        piston_x, mid = [(xnew, y) for y in ynew]
 
 
         if graphwidget == self.graphWidget_0:
@@ -124,12 +96,6 @@ class MainWindow(QtWidgets.QMainWindow):
             self.plot_mod(mid[0], mid[1], "Valve Pos Mid gear", 'b', 2)
             #self.plot_mod(rev[0], rev[1], "Valve Pos Rev 20 deg", 'g', 2)
 
-    def smooth_curves(self, x_val, y_val):
-        xnew = np.linspace(min(x_val), max(x_val), 100)
-        spline = make_interp_spline(x_val, y_val, 3)
-        ynew = spline(xnew)
-        return xnew, ynew
-
     def centre_valve_positions(self, val):
         """Valve displacement from centre position (304.8)"""
         val = val - 305
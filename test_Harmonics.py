@@ -0,0 +1,23 @@
+"""
+Fourier series fits of the closed-form model's curves
+"""
+import numpy as np
+import FirthKinematics
+import Harmonics
+
+CRANK = np.arange(0, 361, 5.0)
+
+
+def test_fit_within_tolerance(capsys):
+    results = FirthKinematics.to_results(
+        FirthKinematics.sweep(CRANK, [60, 120]))
+    harmonic_fit = Harmonics.fit_results(results)
+    assert (harmonic_fit.residual <= 0.01).all()
+    assert 'OUTSIDE TOLERANCE' not in capsys.readouterr().out
+
+
+def test_fit_warns_outside_tolerance(capsys):
+    square = np.sign(np.sin(np.radians(CRANK)))
+    harmonic_fit = Harmonics.fit(CRANK, square)
+    assert harmonic_fit.residual > 0.01
+    assert 'OUTSIDE TOLERANCE' in capsys.readouterr().out
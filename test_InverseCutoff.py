@@ -0,0 +1,36 @@
+"""
+Inverse cutoff search on the closed-form model
+"""
+import numpy as np
+import FirthKinematics
+import InverseCutoff
+import ValveEvents
+
+
+def test_forward_cutoff_monotonic():
+    search = InverseCutoff.CutoffSearch(InverseCutoff.analytic_measure())
+    samples = search.reachable((90, 50), points=9)
+    angles, percents = np.array(samples).T
+    assert len(samples) > 4
+    assert (np.diff(angles) > 0).all()
+    assert (np.diff(percents) < 0).all()
+    assert 70 < percents[0] < 100
+
+
+def test_finds_targets_on_cutoff_stroke():
+    fwd, rev = InverseCutoff.find_cutoffs(
+        InverseCutoff.analytic_measure(), 30, 60)
+    assert abs(fwd['percent'] - 30) < 0.5
+    assert abs(rev['percent'] - 60) < 0.5
+    # Forward head end cutoff is on its out stroke, before crank dead centre
+    assert 0 < fwd['event'] < 180
+    assert 50 < fwd['angle'] < 90 < rev['angle'] < 130
+
+
+def test_agrees_with_valve_events():
+    fwd, _ = InverseCutoff.find_cutoffs(
+        InverseCutoff.analytic_measure(), 50, 50)
+    results = FirthKinematics.to_results(FirthKinematics.sweep(
+        np.arange(0, 361, 1.0), [fwd['angle']]))
+    events = ValveEvents.results_events(results)
+    assert abs(events['head_cutoff_pct'][0] - 50) < 1
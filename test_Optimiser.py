@@ -0,0 +1,25 @@
+"""
+Optimiser scoring on the closed-form model
+"""
+import numpy as np
+import Optimiser
+
+DESIGN = {'fwd_cutoff': 60.0, 'rev_cutoff': 120.0}
+
+
+def test_working_design_scores():
+    scores = Optimiser.evaluate_analytic(DESIGN, 50)
+    assert np.isfinite(scores).all()
+    assert (scores < Optimiser.PENALTY).all()
+
+
+def test_penalty_graded_by_shortfall():
+    short = Optimiser.evaluate_analytic(DESIGN, 50, lap=4.0)
+    shorter = Optimiser.evaluate_analytic(DESIGN, 50, lap=5.0)
+    assert Optimiser.PENALTY < short[0] < shorter[0] < np.inf
+
+
+def test_pareto_front_keeps_penalised_designs():
+    scores = np.array([[Optimiser.PENALTY + 2] * 3,
+                       [Optimiser.PENALTY + 1] * 3])
+    assert list(Optimiser.pareto_front(scores)) == [False, True]
@@ -0,0 +1,29 @@
+"""
+Indicated work of the closed-form model, so it runs without FreeCAD
+"""
+import numpy as np
+import FirthKinematics
+import SteamFlow
+
+CRANK = np.arange(0, 361, 2.0)
+
+
+def indicator(cutoffs):
+    results = FirthKinematics.to_results(
+        FirthKinematics.sweep(CRANK, cutoffs))
+    return SteamFlow.simulate(results, [500, 1000])
+
+
+def test_forward_work_positive():
+    work = indicator([50, 60, 70]).work
+    assert (work > 0).all()
+
+
+def test_reverse_work_positive():
+    work = indicator([120, 130]).work
+    assert (work > 0).all()
+
+
+def test_work_falls_towards_mid_gear():
+    power = indicator([50, 60, 70]).power
+    assert (np.diff(power, axis=-1) < 0).all()
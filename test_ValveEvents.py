@@ -0,0 +1,43 @@
+"""
+Valve events of the closed-form model, so they run without FreeCAD
+"""
+import numpy as np
+import FirthKinematics
+import ValveEvents
+
+CRANK = np.arange(0, 361, 2.0)
+# Full forward gear towards mid gear
+FORWARD = [50, 55, 60, 65, 70, 75]
+
+
+def forward_events():
+    results = FirthKinematics.to_results(
+        FirthKinematics.sweep(CRANK, FORWARD))
+    return ValveEvents.results_events(results)
+
+
+def test_cutoff_falls_towards_mid_gear():
+    events = forward_events()
+    for end in ('head', 'crank'):
+        cutoff = events[end + '_cutoff_pct']
+        assert np.isfinite(cutoff).all()
+        assert (np.diff(cutoff) < 0).all()
+        assert 70 < cutoff[0] < 100
+
+
+def test_lead_at_full_gear():
+    events = forward_events()
+    assert 0 <= events['head_lead'][0] < 1
+
+
+def test_head_admitted_at_head_dead_centre():
+    events = forward_events()
+    pct = events['head_admission_pct']
+    assert (pct < 5).all()
+
+
+def test_summary_skips_bad_files(tmp_path, capsys):
+    bad = tmp_path / 'events.csv'
+    bad.write_text('file,cutoff\nx.csv,50\n')
+    assert ValveEvents.summary([str(bad)]) == []
+    assert 'SKIPPED' in capsys.readouterr().out